@@ -6,17 +6,139 @@ Analyzes and optimizes Excel processing for large files
 
 import sys
 import time
-import psutil
 import os
+import statistics
+import subprocess
+import dataclasses
 
 # Add src directory to path for imports
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+sys.path.insert(0, SRC_DIR)
 
 from excel_processor.config import DEFAULT_CONFIG
 from excel_processor.batch import RobustBatchProcessor
 
-def benchmark_processing(entity_folder: str, summary_path: str):
-    """Benchmark processing performance"""
+STARTUP_BUDGET_SECONDS = 1.0
+HEAVY_MODULES = ('pandas', 'xlwings', 'pythoncom', 'psutil')
+
+def benchmark_startup(runs: int = 5, budget: float = STARTUP_BUDGET_SECONDS) -> bool:
+    """Guard CLI startup: `--help` must stay under budget and the package import must stay light"""
+    print("🚀 CLI Startup Benchmark")
+    print("=" * 50)
+    script = os.path.join(SRC_DIR, 'scripts', 'process_entities.py')
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, script, '--help'], capture_output=True, check=True)
+        times.append(time.perf_counter() - t0)
+    median = statistics.median(times)
+    print(f"⏱️  process_entities.py --help: median {median*1000:.0f}ms, "
+          f"max {max(times)*1000:.0f}ms over {runs} runs (budget {budget*1000:.0f}ms)")
+
+    probe = (f"import sys; sys.path.insert(0, {SRC_DIR!r}); "
+             "import excel_processor, excel_processor.config, excel_processor.batch, excel_processor.delta; "
+             f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    leaked = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True,
+                            check=True).stdout.strip()
+    if leaked:
+        print(f"❌ Heavy modules imported eagerly: {leaked}")
+    else:
+        print("✅ No heavy modules imported at package import")
+
+    ok = median <= budget and not leaked
+    print(f"{'✅' if ok else '❌'} Startup {'within' if ok else 'over'} budget")
+    return ok
+
+def check_supervisor() -> bool:
+    """Exercise ProcessSupervisor against dummy child processes (no Excel needed)"""
+    import threading
+    import psutil
+    from excel_processor.supervisor import ProcessSupervisor
+    print("🔪 Process Supervisor Check")
+    print("=" * 50)
+    sleeper = [sys.executable, '-c', 'import time; time.sleep(60)']
+    checks = []
+
+    def check(label: str, ok: bool):
+        checks.append(ok)
+        print(f"{'✅' if ok else '❌'} {label}")
+
+    sup = ProcessSupervisor(wall_limit=0.5, poll_interval=0.1)
+    stranger = subprocess.Popen(sleeper)  # not registered: must never be touched
+    try:
+        quick = sup.spawn([sys.executable, '-c', 'pass'], label="quick")
+        quick.wait(timeout=10)
+        t0 = time.perf_counter()
+        sup.release(quick.pid)
+        check(f"Exited child released without waiting ({(time.perf_counter() - t0) * 1000:.0f}ms)",
+              time.perf_counter() - t0 < 1.0 and quick.pid not in sup.active_pids())
+
+        hung = sup.spawn(sleeper, label="hung")
+        sup.release(hung.pid, grace=0.2)
+        check("Child ignoring quit killed after grace", hung.poll() is not None)
+
+        runaway = sup.spawn(sleeper, label="runaway")
+        sup.park(runaway.pid)
+        time.sleep(0.8)
+        check("Parked child survives the wall-clock limit", runaway.poll() is None)
+        sup.rearm(runaway.pid)
+        deadline = time.monotonic() + 5
+        while runaway.poll() is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        check("Re-armed child killed at the wall-clock limit",
+              runaway.poll() is not None and "wall-clock" in sup.kill_reason(runaway.pid))
+
+        sup.wall_limit = 0
+        reused = sup.spawn(sleeper, label="reused")
+        sup._kill_reasons[reused.pid] = "stale"  # as if a killed session had held this PID before
+        sup.register(reused.pid, "reused", popen=reused)
+        check("Reused PID does not inherit an old kill reason", not sup.kill_reason(reused.pid))
+        sup.release(reused.pid, grace=0)
+
+        mine = sup.spawn(sleeper, label="mine")
+        theirs = []
+        t = threading.Thread(target=lambda: theirs.append(sup.spawn(sleeper, label="theirs")))
+        t.start(); t.join()
+        sup.sweep_orphans(owner=threading.get_ident())
+        check("Orphan sweep kills only the calling thread's children",
+              mine.poll() is not None and theirs[0].poll() is None)
+
+        sup.shutdown()
+        check("Shutdown kills the remaining children", theirs[0].wait(timeout=5) is not None)
+        check("Unregistered process left alone", psutil.pid_exists(stranger.pid) and stranger.poll() is None)
+    finally:
+        sup.shutdown()
+        stranger.kill()
+        stranger.wait()
+
+    ok = all(checks)
+    print(f"{'✅' if ok else '❌'} {sum(checks)}/{len(checks)} supervisor checks passed")
+    return ok
+
+def benchmark_schedule(entity_folder: str, state_dir: str, workers: int):
+    """Predicted batch time for folder order vs longest-first, from the learned cost model"""
+    from excel_processor.scheduler import FileCostModel
+    print("🗓️  Schedule Benchmark")
+    print("=" * 50)
+    file_paths = [os.path.join(entity_folder, f) for f in os.listdir(entity_folder)
+                  if f.endswith('.xlsb') and not f.startswith('~')]
+    if not file_paths:
+        print("❌ No XLSB files found!")
+        return
+    model = FileCostModel(state_dir)
+    ordered = model.order(file_paths)
+    costs = {fp: model.estimate(fp)[0] for fp in file_paths}
+    print(f"📁 {len(file_paths)} files, estimated {sum(costs.values()):.0f}s of work")
+    for label, batched in (("par (batches)", True), ("proc (work queue)", False)):
+        for n in sorted({2, workers}):
+            before = FileCostModel.makespan([costs[fp] for fp in file_paths], n, batched)
+            after = FileCostModel.makespan([costs[fp] for fp in ordered], n, batched)
+            print(f"   {label:24s} {n} workers: {before:7.0f}s -> {after:7.0f}s "
+                  f"({1 - after / before if before else 0:.0%} shorter)")
+
+def benchmark_processing(entity_folder: str, summary_path: str, profile: str = None, profile_dir: str = None):
+    """Benchmark processing performance (optionally with per-file CPU profiles of both runs)"""
+    import psutil
     print("🚀 XLSB Performance Benchmark")
     print("=" * 50)
     
@@ -39,7 +161,11 @@ def benchmark_processing(entity_folder: str, summary_path: str):
     
     # Test sequential vs parallel
     file_paths = [os.path.join(entity_folder, f) for f in xlsb_files]
-    processor = RobustBatchProcessor(DEFAULT_CONFIG)
+    config = DEFAULT_CONFIG
+    if profile:
+        config = dataclasses.replace(config, cpu_profile=profile, cpu_profile_dir=profile_dir or os.path.join(
+            entity_folder, "..", "profiles", "benchmark-" + time.strftime("%Y%m%d-%H%M%S")))
+    processor = RobustBatchProcessor(config)
     
     print("🛡️  Testing SEQUENTIAL mode...")
     start_time = time.time()
@@ -86,12 +212,40 @@ def benchmark_processing(entity_folder: str, summary_path: str):
         print("   • Close other Excel applications")
         print("   • Use SSD storage for better I/O")
 
+    if processor.cpu_profiler:
+        processor.cpu_profiler.print_report()
+
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description="Benchmark XLSB processing performance")
-    parser.add_argument("--entity-folder", required=True, help="Folder containing *.xlsb files")
-    parser.add_argument("--summary-path", required=True, help="Path to summary Excel file")
+    parser.add_argument("--entity-folder", help="Folder containing *.xlsb files")
+    parser.add_argument("--summary-path", help="Path to summary Excel file")
+    parser.add_argument("--startup", action="store_true",
+                        help="Only run the CLI startup-time benchmark (exit code 1 when over budget)")
+    parser.add_argument("--profile", nargs="?", const="det", choices=["det", "sample"], default=None,
+                        help="CPU-profile every file (det=cProfile, sample=stack sampling) and print merged hotspots")
+    parser.add_argument("--profile-dir", default=None, help="Where per-file profile dumps are written")
+    parser.add_argument("--supervisor", action="store_true",
+                        help="Only check the process supervisor against dummy child processes (exit code 1 on failure)")
+    parser.add_argument("--schedule", action="store_true",
+                        help="Only compare predicted batch time in folder order vs longest-first")
+    parser.add_argument("--state-dir", default=None,
+                        help="Cost model directory for --schedule (default: <entity-folder>/../.sync_state)")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET_SECONDS,
+                        help="Startup budget in seconds for --startup")
     
     args = parser.parse_args()
-    benchmark_processing(args.entity_folder, args.summary_path)
\ No newline at end of file
+    if args.startup:
+        sys.exit(0 if benchmark_startup(budget=args.startup_budget) else 1)
+    if args.supervisor:
+        sys.exit(0 if check_supervisor() else 1)
+    if args.schedule:
+        if not args.entity_folder:
+            parser.error("--entity-folder is required for --schedule")
+        benchmark_schedule(args.entity_folder, args.state_dir or os.path.join(args.entity_folder, "..", ".sync_state"),
+                           DEFAULT_CONFIG.max_excel_instances)
+        sys.exit(0)
+    if not args.entity_folder or not args.summary_path:
+        parser.error("--entity-folder and --summary-path are required for the processing benchmark")
+    benchmark_processing(args.entity_folder, args.summary_path, args.profile, args.profile_dir)
\ No newline at end of file
@@ -1,7 +1,18 @@
 # excel_processor/__init__.py
 from .models import ProcessingConfig, ProcessingResult
-from .batch import RobustBatchProcessor
-from .processor import EnhancedExcelProcessor
+
+# pandas / xlwings / pythoncom are only pulled in when a processor is used,
+# so `import excel_processor` stays cheap and works off Windows.
+_LAZY = {
+    "RobustBatchProcessor": ".batch",
+    "EnhancedExcelProcessor": ".processor",
+}
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
     "ProcessingConfig",
@@ -1,48 +1,96 @@
 # excel_processor/batch.py
-import os, time, gc
-from typing import List
+from __future__ import annotations
+import os, gc, time, threading
+from typing import Dict, List, Optional, TYPE_CHECKING
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from .models import ProcessingConfig, ProcessingResult
-from .com_management import COMManager
-from .processor import EnhancedExcelProcessor
+from .models import ProcessingConfig, ProcessingResult, WorkerStats
+from .retry import RetryPolicy
+from .supervisor import ProcessSupervisor
+from .memory_optimizer import MemoryProfiler
+from .cpu_profiler import CpuProfiler
+from .changelog import ChangeLogWriter
+
+if TYPE_CHECKING:
+    from .processor import EnhancedExcelProcessor
 
 class RobustBatchProcessor:
     def __init__(self, config: ProcessingConfig):
         self.config = config
+        self.retry_policy = RetryPolicy.from_config(config)
+        self.supervisor = ProcessSupervisor.from_config(config)
+        self.memory_profiler: Optional[MemoryProfiler] = (
+            MemoryProfiler.from_config(config, self.supervisor) if config.memory_profiling else None
+        )
+        self.cpu_profiler: Optional[CpuProfiler] = (
+            CpuProfiler.from_config(config) if config.cpu_profile else None
+        )
+        self.change_log: Optional[ChangeLogWriter] = (
+            ChangeLogWriter(config.change_log_path) if config.change_log_path else None
+        )
+        self._processor: Optional[EnhancedExcelProcessor] = None
+        self._summary_path: Optional[str] = None
+        self._pool_workers: Dict[int, WorkerStats] = {}  # last proc run; cache stats live in the workers
+
+    def load_processor(self, summary_path: str) -> EnhancedExcelProcessor:
+        """Load the summary once per batch processor; delta planning and the run share it."""
+        if self._processor is None or self._summary_path != summary_path:
+            from .processor import EnhancedExcelProcessor
+            processor = EnhancedExcelProcessor(self.config, supervisor=self.supervisor,
+                                               profiler=self.memory_profiler, cpu_profiler=self.cpu_profiler,
+                                               retry_policy=self.retry_policy)
+            processor.change_log = self.change_log
+            processor.load_summary_data_enhanced(summary_path)
+            self._processor, self._summary_path = processor, summary_path
+        return self._processor
+
+    def _begin_run(self, summary_path: str) -> EnhancedExcelProcessor:
+        self._pool_workers = {}
+        if self.memory_profiler:
+            self.memory_profiler.start()
+        processor = self.load_processor(summary_path)
+        if self.memory_profiler:
+            # trace only what processing allocates, not pandas/openpyxl imports
+            self.memory_profiler.start_tracing()
+        return processor
+
+    def _end_run(self):
+        self.supervisor.shutdown()
+        if self.change_log:
+            self.change_log.close()
+            self.change_log.merge_parts()  # process-pool workers
+        if self.memory_profiler:
+            self.memory_profiler.sample()
+            self.memory_profiler.stop()
 
     def process_files_sequential_robust(self, file_paths: List[str], summary_path: str) -> List[ProcessingResult]:
         print(f"🚀 Starting SEQUENTIAL ROBUST processing")
         print(f"   📁 Files: {len(file_paths)} | 🛡️ Mode: Sequential")
 
-        COMManager.kill_excel_processes(); time.sleep(2)
-        processor = EnhancedExcelProcessor(self.config)
-        processor.load_summary_data_enhanced(summary_path)
+        processor = self._begin_run(summary_path)
 
         results = []
-        for i, fp in enumerate(file_paths):
-            print(f"\n📦 Processing file {i+1}/{len(file_paths)}: {os.path.basename(fp)}")
-            result = None
-            for attempt in range(self.config.retry_attempts):
-                if attempt > 0:
-                    print(f"   🔄 Retry attempt {attempt+1}")
-                    time.sleep(2)
-                result = processor.process_single_file_enhanced(fp)
-                if result.status == 'success':
-                    break
-                COMManager.kill_excel_processes(); time.sleep(1)
-            results.append(result)
-            gc.collect(); time.sleep(0.1)  # Reduced delay between files
+        try:
+            for i, fp in enumerate(file_paths):
+                print(f"\n📦 Processing file {i+1}/{len(file_paths)}: {os.path.basename(fp)}")
+                results.append(self._process_with_retry(processor, fp))
+                gc.collect()
+        finally:
+            self._end_run()
         return results
 
     def process_files_parallel_conservative(self, file_paths: List[str], summary_path: str) -> List[ProcessingResult]:
         print(f"🚀 Starting CONSERVATIVE PARALLEL processing")
         print(f"   📁 Files: {len(file_paths)} | 🔧 Max workers: {self.config.max_excel_instances}")
 
-        COMManager.kill_excel_processes(); time.sleep(2)
-        processor = EnhancedExcelProcessor(self.config)
-        processor.load_summary_data_enhanced(summary_path)
+        processor = self._begin_run(summary_path)
 
+        try:
+            return self._run_parallel_batches(processor, file_paths)
+        finally:
+            self._end_run()
+
+    def _run_parallel_batches(self, processor: EnhancedExcelProcessor, file_paths: List[str]) -> List[ProcessingResult]:
         batch_size = self.config.max_excel_instances
         batches = [file_paths[i:i+batch_size] for i in range(0, len(file_paths), batch_size)]
         all_results = []
@@ -51,7 +99,8 @@ class RobustBatchProcessor:
             with ThreadPoolExecutor(max_workers=len(batch)) as ex:
                 fut_map = {ex.submit(self._process_with_retry, processor, fp): fp for fp in batch}
                 batch_results = []
-                for fut in as_completed(fut_map, timeout=self.config.timeout_seconds):
+                # no batch-wide timeout: the supervisor kills only the session that overruns
+                for fut in as_completed(fut_map):
                     fp = fut_map[fut]
                     try:
                         res = fut.result()
@@ -67,20 +116,89 @@ class RobustBatchProcessor:
             all_results.extend(batch_results)
             if bi < len(batches)-1:
                 print("   🧹 Cleaning up between batches...")
-                COMManager.kill_excel_processes(); gc.collect(); time.sleep(1)  # Reduced cleanup delay
+                killed = self.supervisor.sweep_orphans(); gc.collect()
+                if killed:
+                    print(f"   🔪 Swept {killed} leftover Excel session(s) from this batch")
         return all_results
 
+    def process_files_pipelined(self, file_paths: List[str], summary_path: str) -> List[ProcessingResult]:
+        print(f"🚀 Starting PIPELINED processing")
+        print(f"   📁 Files: {len(file_paths)} | 🧵 Queue depth: {self.config.pipeline_queue_depth} "
+              f"| 🔧 Max Excel sessions: {self.config.max_excel_instances}")
+
+        processor = self._begin_run(summary_path)
+
+        from .pipeline import StagedPipeline
+        pipeline = StagedPipeline(self.config, processor, self.retry_policy)
+        try:
+            results = pipeline.run(file_paths)
+        finally:
+            self._end_run()
+        pipeline.print_report()
+        return results
+
+    def process_files_process_pool(self, file_paths: List[str], summary_path: str) -> List[ProcessingResult]:
+        print(f"🚀 Starting PROCESS POOL processing")
+        print(f"   📁 Files: {len(file_paths)} | 🔧 Worker processes: {self.config.max_excel_instances}")
+
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from .shared_summary import SharedSummary
+        processor = self._begin_run(summary_path)
+        summary_file = SharedSummary.publish(processor.summary_data, processor.summary_columns())
+        print(f"   🗂️ Published summary once: {os.path.getsize(summary_file) / 1024 / 1024:.1f}MB "
+              f"memory-mapped columnar file")
+
+        results: Dict[str, ProcessingResult] = {}
+        workers: Dict[int, WorkerStats] = {}
+        try:
+            # spawn everywhere: same behaviour as Windows, and no forking of COM/monitor threads
+            with ProcessPoolExecutor(max_workers=self.config.max_excel_instances,
+                                     mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_pool_worker_init,
+                                     initargs=(self.config, summary_file, time.time())) as ex:
+                fut_map = {ex.submit(_pool_worker_run, fp): fp for fp in file_paths}
+                for fut in as_completed(fut_map):
+                    fp = fut_map[fut]
+                    try:
+                        res, ws = fut.result()
+                        known = workers.setdefault(ws.pid, ws)
+                        known.peak_rss_mb = max(known.peak_rss_mb, ws.peak_rss_mb)
+                        known.files += 1
+                        known.cache, known.memory = ws.cache, ws.memory  # cumulative in the worker
+                        if res.status == 'success':
+                            print(f"   ✅ {os.path.basename(fp)}: {res.rows_updated} upd, {res.rows_added} add")
+                        else:
+                            print(f"   ❌ {os.path.basename(fp)}: {res.error_message}")
+                    except Exception as e:
+                        print(f"   💥 {os.path.basename(fp)} failed: {e}")
+                        res = ProcessingResult(filepath=fp, status='error', error_message=f"Execution failed: {e}")
+                    results[fp] = res
+        finally:
+            try:
+                os.remove(summary_file)
+            except OSError:
+                pass
+            self._end_run()
+        self._pool_workers = workers
+        if self.memory_profiler:
+            for ws in workers.values():
+                if ws.memory:
+                    self.memory_profiler.merge(ws.memory)
+
+        print("\n👷 PROCESS POOL WORKERS")
+        for ws in sorted(workers.values(), key=lambda w: w.pid):
+            print(f"   pid {ws.pid}: ready in {ws.start_latency:.2f}s (attach {ws.attach_ms:.0f}ms) | "
+                  f"RSS {ws.ready_rss_mb:.0f}MB at start, {ws.peak_rss_mb:.0f}MB max | {ws.files} file(s)")
+        return [results[fp] for fp in file_paths]
+
     def _process_with_retry(self, processor: EnhancedExcelProcessor, filepath: str) -> ProcessingResult:
-        res = None
-        for attempt in range(self.config.retry_attempts):
-            if attempt > 0:
-                print(f"   🔄 Retrying {os.path.basename(filepath)} (attempt {attempt+1})")
-                time.sleep(0.5)  # Reduced retry delay
-            res = processor.process_single_file_enhanced(filepath)
-            if res.status == 'success':
-                return res
-            COMManager.kill_excel_processes(); time.sleep(0.2)  # Reduced process kill delay
-        return res
+        return self.retry_policy.run_file(
+            filepath,
+            lambda: processor.process_single_file_enhanced(filepath),
+            # only this worker's leftovers; sibling sessions keep running
+            reset_backend=lambda: self.supervisor.sweep_orphans(owner=threading.get_ident()),
+        )
 
     def print_enhanced_summary(self, results: List[ProcessingResult]):
         ok = [r for r in results if r.status == 'success']
@@ -95,3 +213,73 @@ class RobustBatchProcessor:
         print(f"   ➕ Total added rows: {total_added}")
         if ok:
             print(f"   ⏱️ Avg time/file: {total_time/len(ok):.1f}s")
+        if self.memory_profiler:
+            self.memory_profiler.print_report()
+        if self.cpu_profiler:
+            self.cpu_profiler.print_report()
+        if self.change_log:
+            print(f"   🧾 Change log: {self.change_log.cells_written} cell change(s) this session -> "
+                  f"{os.path.abspath(self.change_log.path)}")
+        if self._pool_workers:
+            hits = sum(ws.cache.get('hits', 0) for ws in self._pool_workers.values())
+            misses = sum(ws.cache.get('misses', 0) for ws in self._pool_workers.values())
+            size = sum(ws.cache.get('size', 0) for ws in self._pool_workers.values())
+            rate = hits / (hits + misses) if hits + misses else 0.0
+            print(f"   🧠 Partition cache: {hits} hits, {misses} misses ({rate:.0%} hit rate, "
+                  f"{size} cached across {len(self._pool_workers)} worker process(es))")
+        elif self._processor:
+            cs = self._processor.cache_stats()
+            print(f"   🧠 Partition cache: {cs['hits']} hits, {cs['misses']} misses "
+                  f"({cs['hit_rate']:.0%} hit rate, {cs['size']} cached)")
+
+# ---------- process-pool workers (module level so they pickle under spawn) ----------
+_worker_state: dict = {}
+
+def _pool_worker_init(config: ProcessingConfig, summary_file: str, pool_started: float):
+    from multiprocessing import util
+    from .processor import EnhancedExcelProcessor
+    from .shared_summary import SharedSummaryView
+    from .memory_optimizer import MemoryOptimizer
+
+    t0 = time.perf_counter()
+    supervisor = ProcessSupervisor.from_config(config)
+    view = SharedSummaryView(summary_file)
+    cpu_profiler = CpuProfiler.from_config(config) if config.cpu_profile else None
+    memory_profiler = MemoryProfiler.from_config(config, supervisor) if config.memory_profiling else None
+    processor = EnhancedExcelProcessor(config, supervisor=supervisor, cpu_profiler=cpu_profiler,
+                                       profiler=memory_profiler,
+                                       retry_policy=RetryPolicy.from_config(config))
+    processor.attach_summary_view(view)
+    if config.change_log_path:
+        # one part file per worker, merged into the main log by the parent
+        processor.change_log = ChangeLogWriter(ChangeLogWriter.part_path(config.change_log_path, os.getpid()))
+    _worker_state.update(
+        processor=processor,
+        policy=processor.retry_policy,
+        stats=WorkerStats(pid=os.getpid(), start_latency=time.time() - pool_started,
+                          attach_ms=(time.perf_counter() - t0) * 1000,
+                          ready_rss_mb=MemoryOptimizer.get_memory_usage()),
+    )
+    # pool workers leave through os._exit, so atexit would never run
+    util.Finalize(None, supervisor.shutdown, exitpriority=10)
+    util.Finalize(None, view.close, exitpriority=5)
+    if memory_profiler:
+        memory_profiler.start()
+        memory_profiler.start_tracing()  # after the summary view is attached, as in the parent
+        util.Finalize(None, memory_profiler.stop, exitpriority=10)
+    if processor.change_log:
+        util.Finalize(None, processor.change_log.close, exitpriority=10)
+
+def _pool_worker_run(filepath: str):
+    from .memory_optimizer import MemoryOptimizer
+    processor: EnhancedExcelProcessor = _worker_state['processor']
+    res = _worker_state['policy'].run_file(
+        filepath,
+        lambda: processor.process_single_file_enhanced(filepath),
+        reset_backend=processor.supervisor.sweep_orphans,  # one file per process at a time
+    )
+    stats: WorkerStats = _worker_state['stats']
+    stats.peak_rss_mb = max(stats.peak_rss_mb, MemoryOptimizer.get_memory_usage())
+    stats.cache = processor.cache_stats()
+    stats.memory = processor.profiler.export() if processor.profiler else None
+    return res, stats
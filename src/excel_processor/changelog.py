@@ -0,0 +1,111 @@
+# excel_processor/changelog.py
+from __future__ import annotations
+import os, csv, glob, time, queue, threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# one row per changed cell; summary_row is the Excel row in the summary sheet
+COLUMNS = ("synced_at", "file", "sheet", "subsidiary", "tenant", "excel_row", "column",
+           "old_value", "new_value", "action", "summary_row")
+
+# (subsidiary, tenant, excel_row, column, old, new, action, summary_row) as built by the processor
+CellChange = Tuple[str, str, int, str, object, object, str, int]
+
+class ChangeLogWriter:
+    """Appends per-cell change records to a CSV file from a background thread.
+
+    ``record`` only queues one list per file; formatting and disk writes
+    happen on the writer thread in blocks of ``flush_rows``. The thread starts
+    on the first record and ``close`` drains it, so one writer can serve
+    several runs (or a watch session that closes it after every sync).
+    """
+
+    def __init__(self, path: str, flush_rows: int = 5000, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.cells_written = 0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def record(self, filepath: str, sheet: str, changes: List[CellChange]):
+        if not changes:
+            return
+        self._ensure_thread()
+        self._queue.put((time.strftime("%Y-%m-%d %H:%M:%S"), os.path.basename(filepath), sheet, changes))
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="change-log", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            out = csv.writer(f)
+            if new_file:
+                out.writerow(COLUMNS)
+            rows: List[tuple] = []
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = ()
+                if item:
+                    synced_at, name, sheet, changes = item
+                    rows.extend((synced_at, name, sheet) + change for change in changes)
+                if rows and (not item or len(rows) >= self.flush_rows):  # idle, closing or full
+                    out.writerows(rows)
+                    f.flush()
+                    self.cells_written += len(rows)
+                    rows = []
+                if item is None:
+                    return
+
+    # ---------- process-pool parts ----------
+    @staticmethod
+    def part_path(path: str, pid: int) -> str:
+        return f"{path}.part-{pid}"
+
+    def merge_parts(self) -> int:
+        """Fold process-pool workers' part files into this log (header once) and delete them."""
+        parts = sorted(glob.glob(glob.escape(self.path) + ".part-*"))
+        if not parts:
+            return 0
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        merged = 0
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            out = csv.writer(f)
+            if new_file:
+                out.writerow(COLUMNS)
+            for part in parts:
+                with open(part, newline="", encoding="utf-8") as pf:
+                    rows = csv.reader(pf)
+                    next(rows, None)  # part header
+                    for row in rows:
+                        out.writerow(row)
+                        merged += 1
+                os.remove(part)
+        self.cells_written += merged
+        return merged
+
+def query_changes(path: str, tenant: str = "", subsidiary: str = "", file: str = "",
+                  column: str = "") -> Iterator[Dict[str, str]]:
+    """Stream change records, keeping those whose fields contain the given text (case-insensitive)."""
+    wanted = {k: v.lower() for k, v in
+              (("tenant", tenant), ("subsidiary", subsidiary), ("file", file), ("column", column)) if v}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if all(v in (row.get(k) or "").lower() for k, v in wanted.items()):
+                yield row
@@ -1,44 +1,62 @@
 # excel_processor/com_management.py
-import time, gc, subprocess
-import xlwings as xw
-import pythoncom
+from __future__ import annotations
+import time
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+from .retry import DEFAULT_RETRY_POLICY, RetryPolicy
+
+if TYPE_CHECKING:
+    import xlwings as xw
+    from .supervisor import ProcessSupervisor
+
+RPC_E_CHANGED_MODE = -2147417850  # thread already initialised in the other apartment
 
 class COMManager:
     @staticmethod
-    def initialize_com() -> bool:
+    def initialize_com(multithreaded: bool = False) -> bool:
+        # Pipeline stages hand one workbook between threads, so they join the
+        # MTA where Excel's out-of-process proxies are valid on every thread.
+        import pythoncom
         try:
-            pythoncom.CoInitialize()
+            if multithreaded:
+                pythoncom.CoInitializeEx(pythoncom.COINIT_MULTITHREADED)
+            else:
+                pythoncom.CoInitialize()
             return True
+        except pythoncom.com_error as e:
+            if e.hresult == RPC_E_CHANGED_MODE:
+                return True
+            print(f"COM initialization failed: {e}")
+            return False
         except Exception as e:
             print(f"COM initialization failed: {e}")
             return False
 
     @staticmethod
     def cleanup_com():
+        import pythoncom
         try:
             pythoncom.CoUninitialize()
         except Exception as e:
             print(f"COM cleanup warning: {e}")
 
-    @staticmethod
-    def kill_excel_processes():
-        try:
-            subprocess.run(['taskkill', '/F', '/IM', 'excel.exe'],
-                           capture_output=True, timeout=5)
-        except Exception as e:
-            print(f"Excel cleanup warning: {e}")
-
 class EnhancedExcelOptimizer:
     @staticmethod
-    def setup_excel_app_robust():
+    def setup_excel_app_robust(supervisor: Optional[ProcessSupervisor] = None,
+                               policy: Optional[RetryPolicy] = None):
+        import xlwings as xw
+        policy = policy or DEFAULT_RETRY_POLICY
         app = None
+        pid = None
         for attempt in range(3):
             try:
                 if not COMManager.initialize_com():
                     continue
                 app = xw.App(visible=False, add_book=False)
-                time.sleep(0.2)  # Reduced wait time
-                _ = app.version  # test
+                pid = getattr(app, 'pid', None)
+                if supervisor:
+                    supervisor.register(pid, label="excel")
+                _ = policy.call(lambda: app.version)  # ready once it answers
                 # Set Excel properties individually with error handling
                 try:
                     app.screen_updating = False
@@ -76,27 +94,24 @@ class EnhancedExcelOptimizer:
                 try:
                     if app: app.quit()
                 except: pass
-                app = None
-                time.sleep((attempt+1) * 0.2)  # Reduced retry delay
+                if supervisor:
+                    supervisor.release(pid, grace=1.0)
+                app = pid = None
+                if attempt < 2:
+                    time.sleep(policy.backoff(attempt))
         return None
 
     @staticmethod
-    def safe_excel_operation(func, *args, **kwargs):
-        for retry in range(2):
-            try:
-                return func(*args, **kwargs)
-            except Exception as e:
-                if retry == 1:
-                    raise e
-                time.sleep(0.05)  # Reduced retry delay
-                gc.collect()
+    def safe_excel_operation(func, *args, policy: Optional[RetryPolicy] = None, **kwargs):
+        # Only "Excel busy" style errors are repeated; anything else surfaces at once.
+        return (policy or DEFAULT_RETRY_POLICY).call(func, *args, **kwargs)
 
     @staticmethod
-    def find_header_row_enhanced(sheet: xw.Sheet):
+    def find_header_row_enhanced(sheet: xw.Sheet, policy: Optional[RetryPolicy] = None):
         for r in range(1, 8):
             try:
                 vals = EnhancedExcelOptimizer.safe_excel_operation(
-                    lambda: sheet.range((r, 1), (r, 15)).value
+                    lambda: sheet.range((r, 1), (r, 15)).value, policy=policy
                 )
                 if vals:
                     vals_str = ' '.join(str(v) for v in vals if v)
@@ -107,3 +122,73 @@ class EnhancedExcelOptimizer:
                 print(f"   ⚠️ check row {r}: {e}")
                 continue
         return None
+
+class ExcelSessionPool:
+    """Warm Excel instances reused across files by a long-running caller (watch mode).
+
+    COM objects belong to the apartment that created them, so a pool must only
+    be used from the thread that owns it. Instances that hit a backend failure,
+    or served ``max_uses`` files, are quit instead of going back to the pool.
+    """
+
+    def __init__(self, supervisor: Optional[ProcessSupervisor] = None, size: int = 1, max_uses: int = 50,
+                 policy: Optional[RetryPolicy] = None):
+        self.supervisor = supervisor
+        self.policy = policy
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self._idle: List[xw.App] = []
+        self._uses: Dict[Optional[int], int] = {}
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self):
+        while self._idle:
+            app = self._idle.pop()
+            pid = getattr(app, 'pid', None)
+            try:
+                _ = app.version  # still answering?
+                if self.supervisor and not self.supervisor.rearm(pid):
+                    raise RuntimeError("session was killed while idle")
+                self.reused += 1
+                return app
+            except Exception as e:
+                print(f"   ♻️ Dropping stale warm Excel (pid {pid}): {e}")
+                self._discard(app)
+        app = EnhancedExcelOptimizer.setup_excel_app_robust(self.supervisor, self.policy)
+        if app:
+            self.created += 1
+            self._uses[getattr(app, 'pid', None)] = 0
+        return app
+
+    def release(self, app, healthy: bool = True):
+        if app is None:
+            return
+        pid = getattr(app, 'pid', None)
+        uses = self._uses.get(pid, 0) + 1
+        self._uses[pid] = uses
+        if healthy and len(self._idle) < self.size and uses < self.max_uses:
+            try:
+                for wb in list(app.books):
+                    wb.close()
+                if self.supervisor:
+                    self.supervisor.park(pid)
+                self._idle.append(app)
+                return
+            except Exception as e:
+                print(f"   ⚠️ Could not park Excel (pid {pid}): {e}")
+        self._discard(app)
+
+    def _discard(self, app):
+        pid = getattr(app, 'pid', None)
+        self._uses.pop(pid, None)
+        try:
+            app.quit()
+        except Exception:
+            pass
+        if self.supervisor:
+            self.supervisor.release(pid)
+
+    def close(self):
+        while self._idle:
+            self._discard(self._idle.pop())
@@ -1,6 +1,9 @@
 # excel_processor/config.py
 from .models import ProcessingConfig
 
+# Summary columns the matcher always needs; COLUMN_MAPPING sources are added on top
+SUMMARY_KEY_COLUMNS = ['Subsidiary', 'Unit name', 'Tenant ID', 'Tenant']
+
 # Mapping for column names in the Excel files
 
 COLUMN_MAPPING = {
@@ -23,7 +26,7 @@ COLUMN_MAPPING = {
 DEFAULT_CONFIG = ProcessingConfig(
     max_excel_instances=4,  # Increased for better parallelism
     timeout_seconds=600,    # Increased timeout for large files
-    retry_attempts=1,       # Reduced retries to avoid excessive delays
+    retry_attempts=3,       # Only transient/crash failures are retried, with backoff
     backup_enabled=True,
     column_mapping=COLUMN_MAPPING
 )
@@ -0,0 +1,177 @@
+# excel_processor/cpu_profiler.py
+from __future__ import annotations
+import os, re, sys, glob, threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from .models import ProcessingConfig
+
+class CpuProfiler:
+    """Opt-in per-file CPU profile, merged into one hotspot table per batch.
+
+    ``det`` runs cProfile in the thread doing a stage; ``sample`` polls the
+    stacks of threads inside a stage every ``interval`` seconds (lower
+    overhead, approximate). Each file gets a dump in ``out_dir``: ``.prof``
+    (pstats / snakeviz) or ``.folded`` (flamegraph.pl / speedscope). The
+    report is built from the dumps, so process-pool workers are included.
+    """
+    MODES = ("det", "sample")
+
+    def __init__(self, mode: str = "det", out_dir: str = "profiles", interval: float = 0.005, top: int = 25):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}; expected one of {self.MODES}")
+        self.mode = mode
+        self.out_dir = out_dir
+        self.interval = interval
+        self.top = top
+        self._lock = threading.Lock()
+        self._profiles: Dict[str, object] = {}        # filepath -> cProfile.Profile
+        self._stacks: Dict[str, Counter] = {}         # filepath -> folded stack -> samples
+        self._threads: Dict[int, str] = {}            # thread ident -> filepath in a stage
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._fallback_noted = False
+
+    @classmethod
+    def from_config(cls, config: ProcessingConfig) -> "CpuProfiler":
+        return cls(mode=config.cpu_profile, out_dir=config.cpu_profile_dir or "profiles",
+                   interval=config.cpu_sample_interval, top=config.cpu_profile_top)
+
+    # ---------- collection ----------
+    @contextmanager
+    def stage(self, filepath: str):
+        """Profile the calling thread while it works on ``filepath``."""
+        prof = None
+        if self.mode == "det":
+            import cProfile
+            with self._lock:
+                prof = self._profiles.setdefault(filepath, cProfile.Profile())
+            try:
+                prof.enable()
+            except ValueError:
+                # Python 3.12+: one cProfile per process; concurrent files get sampled instead
+                prof = None
+                if not self._fallback_noted:
+                    self._fallback_noted = True
+                    print("   ⚠️ cProfile already active in another thread, sampling concurrent files")
+        if prof is not None:
+            try:
+                yield
+            finally:
+                prof.disable()
+            return
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] = filepath
+            self._stacks.setdefault(filepath, Counter())
+        self._ensure_sampler()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads.pop(ident, None)
+
+    def _ensure_sampler(self):
+        with self._lock:
+            if self._sampler and self._sampler.is_alive():
+                return
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name="cpu-sampler", daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                watched = dict(self._threads)
+            if not watched:
+                continue
+            frames = sys._current_frames()
+            for ident, filepath in watched.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                with self._lock:
+                    self._stacks[filepath][";".join(reversed(stack))] += 1
+
+    def end_file(self, filepath: str):
+        """Write this file's dump (rewritten with accumulated data if the file is retried)."""
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, re.sub(r'[^\w.-]+', '_', os.path.basename(filepath)))
+        with self._lock:
+            prof = self._profiles.get(filepath)
+            stacks = dict(self._stacks.get(filepath, {}))
+        if prof is not None:
+            prof.dump_stats(base + ".prof")
+        if stacks:
+            with open(base + ".folded", "w", encoding="utf-8") as f:
+                for stack, n in stacks.items():
+                    f.write(f"{stack} {n}\n")
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join(timeout=self.interval + 1)
+        self._sampler = None
+
+    # ---------- reporting ----------
+    def print_report(self):
+        self.stop()
+        print(f"\n🔥 CPU PROFILE ({self.mode}) -> {os.path.abspath(self.out_dir)}")
+        profs = sorted(glob.glob(os.path.join(self.out_dir, "*.prof")))
+        folded = sorted(glob.glob(os.path.join(self.out_dir, "*.folded")))
+        if not profs and not folded:
+            print("   No profiles recorded")
+            return
+        if profs:
+            self._print_pstats(profs)
+        if folded:
+            self._print_samples(folded)
+
+    def _print_pstats(self, paths):
+        import pstats
+        per_file = []
+        merged = None
+        for path in paths:
+            st = pstats.Stats(path)
+            per_file.append((st.total_tt, os.path.basename(path)[:-5]))
+            merged = st if merged is None else merged.add(st)
+        self._print_files(per_file, "s")
+        print(f"   {'self s':>9} {'cum s':>9} {'calls':>9}  function")
+        rows = sorted(merged.stats.items(), key=lambda kv: -kv[1][2])
+        for (filename, line, func), (cc, nc, tt, ct, _) in rows[:self.top]:
+            where = f"{os.path.basename(filename)}:{line}" if line else filename
+            calls = f"{nc}/{cc}" if nc != cc else str(nc)
+            print(f"   {tt:9.3f} {ct:9.3f} {calls:>9}  {func} ({where})")
+
+    def _print_samples(self, paths):
+        own: Counter = Counter()
+        total: Counter = Counter()
+        per_file = []
+        samples = 0
+        for path in paths:
+            n_file = 0
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    stack, _, n = line.rstrip("\n").rpartition(" ")
+                    n = int(n)
+                    frames = stack.split(";")
+                    own[frames[-1]] += n
+                    for fr in set(frames):
+                        total[fr] += n
+                    n_file += n
+            per_file.append((n_file * self.interval, os.path.basename(path)[:-7]))
+            samples += n_file
+        self._print_files(per_file, "s sampled")
+        print(f"   {'self %':>7} {'total %':>8}  function ({samples} samples @ {self.interval * 1000:g}ms)")
+        for fr, n in own.most_common(self.top):
+            print(f"   {n / samples:7.1%} {total[fr] / samples:8.1%}  {fr}")
+
+    def _print_files(self, per_file, unit: str):
+        for t, name in sorted(per_file, reverse=True)[:5]:
+            print(f"   ⏱️ {name}: {t:.2f}{unit}")
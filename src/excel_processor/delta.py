@@ -0,0 +1,158 @@
+# excel_processor/delta.py
+from __future__ import annotations
+import os, json, hashlib
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+from .models import ProcessingResult, SubsidiaryChange, DeltaPlan
+from .subsidiary import SubsidiaryExtractor
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+Snapshot = Dict[str, Dict[str, str]]  # subsidiary -> row key -> row hash
+
+class SummaryDeltaTracker:
+    """Row-level summary diff plus a subsidiary -> entity file dependency index.
+
+    State lives in two JSON files under ``state_dir``: the summary snapshot of
+    the previous run and, per entity file, the subsidiary it resolved to and
+    whether it synced. Only files whose summary partition changed (or that have
+    no successful history) are scheduled.
+    """
+    SNAPSHOT_FILE = "summary_snapshot.json"
+    INDEX_FILE = "subsidiary_index.json"
+
+    def __init__(self, state_dir: str):
+        self.state_dir = state_dir
+        self.previous: Snapshot = {}
+        self.index: Dict[str, dict] = {}
+        self._load_state()
+
+    # ---------- state ----------
+    def _path(self, name: str) -> str:
+        return os.path.join(self.state_dir, name)
+
+    def _load_state(self):
+        for name, attr in ((self.SNAPSHOT_FILE, 'previous'), (self.INDEX_FILE, 'index')):
+            try:
+                with open(self._path(name), encoding="utf-8") as f:
+                    setattr(self, attr, json.load(f))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"   ⚠️ Ignoring unreadable delta state {name}: {e}")
+
+    def _save_json(self, name: str, data):
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp = self._path(name) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self._path(name))
+
+    # ---------- snapshot / diff ----------
+    @staticmethod
+    def snapshot(summary: pd.DataFrame, columns: List[str]) -> Snapshot:
+        """Hash every summary row, keyed by Unit name|Tenant ID|Tenant within its Subsidiary."""
+        cols = [c for c in columns if c in summary.columns]
+        snap: Snapshot = {}
+        seen: Dict[Tuple[str, str], int] = {}
+        for values in summary[cols].astype(str).itertuples(index=False, name=None):
+            row = dict(zip(cols, values))
+            sub = row['Subsidiary'].strip()
+            key = f"{row['Unit name'].strip()}|{row['Tenant ID'].strip()}|{row['Tenant'].strip()}"
+            n = seen.get((sub, key), 0)
+            seen[(sub, key)] = n + 1
+            if n:
+                key = f"{key}#{n}"  # keep duplicate keys distinct, in sheet order
+            digest = hashlib.blake2b('\x1f'.join(values).encode("utf-8"), digest_size=12).hexdigest()
+            snap.setdefault(sub, {})[key] = digest
+        return snap
+
+    @staticmethod
+    def diff(old: Snapshot, new: Snapshot) -> Dict[str, SubsidiaryChange]:
+        changes: Dict[str, SubsidiaryChange] = {}
+        for sub in set(old) | set(new):
+            before, after = old.get(sub, {}), new.get(sub, {})
+            ch = SubsidiaryChange(
+                subsidiary=sub,
+                added=sum(1 for k in after if k not in before),
+                removed=sum(1 for k in before if k not in after),
+                changed=sum(1 for k, h in after.items() if k in before and before[k] != h),
+            )
+            if ch.total:
+                changes[sub] = ch
+        return changes
+
+    # ---------- planning ----------
+    def plan(self, file_paths: List[str], current: Snapshot) -> DeltaPlan:
+        plan = DeltaPlan(changes=self.diff(self.previous, current))
+        names = sorted(set(self.previous) | set(current))
+        for fp in file_paths:
+            entry = self.index.get(os.path.abspath(fp))
+            if not self.previous:
+                plan.selected[fp] = "no previous summary snapshot"
+            elif not entry:
+                plan.selected[fp] = "no dependency history"
+            elif entry.get("status") != "success":
+                plan.selected[fp] = f"previous run ended with '{entry.get('status')}'"
+            else:
+                partition = set(entry.get("partition", []))
+                partition |= set(SubsidiaryExtractor.match_summary_names(entry.get("subsidiary_found", ""), names))
+                hit = sorted(s for s in partition if s in plan.changes)
+                if hit:
+                    plan.selected[fp] = "summary changed for " + ", ".join(
+                        f"{s} (+{plan.changes[s].added}/-{plan.changes[s].removed}/~{plan.changes[s].changed})"
+                        for s in hit)
+                else:
+                    plan.skipped[fp] = f"partition {sorted(partition) or ['<none>']} unchanged"
+        return plan
+
+    def skipped_results(self, plan: DeltaPlan) -> List[ProcessingResult]:
+        out = []
+        for fp, reason in plan.skipped.items():
+            entry = self.index.get(os.path.abspath(fp), {})
+            out.append(ProcessingResult(filepath=fp, status='skipped', error_message=reason,
+                                        subsidiary_found=entry.get("subsidiary_found", "")))
+        return out
+
+    def record_run(self, results: List[ProcessingResult], current: Snapshot):
+        """Fold this run's results into the index and make ``current`` the new baseline."""
+        names = list(current)
+        for r in results:
+            if r.status == 'skipped':
+                continue
+            self.index[os.path.abspath(r.filepath)] = {
+                "subsidiary_found": r.subsidiary_found,
+                "partition": SubsidiaryExtractor.match_summary_names(r.subsidiary_found, names),
+                "status": r.status,
+            }
+        self._save_json(self.INDEX_FILE, self.index)
+        self._save_json(self.SNAPSHOT_FILE, current)
+        self.previous = current
+
+    @staticmethod
+    def print_plan(plan: DeltaPlan):
+        print("\n🔎 SUMMARY DELTA")
+        if plan.changes:
+            for sub, ch in sorted(plan.changes.items()):
+                print(f"   Δ {sub or '<blank>'}: +{ch.added} added, -{ch.removed} removed, ~{ch.changed} changed")
+        else:
+            print("   No summary rows changed since the last run")
+        for fp, reason in plan.selected.items():
+            print(f"   ▶️ {os.path.basename(fp)}: {reason}")
+        for fp, reason in plan.skipped.items():
+            print(f"   ⏭️ {os.path.basename(fp)}: {reason}")
+        print(f"   📋 Scheduled {len(plan.selected)} file(s), skipped {len(plan.skipped)}")
+
+    def print_state(self, file_paths: List[str]):
+        """Show what the last run recorded, without loading the summary."""
+        rows = sum(len(v) for v in self.previous.values())
+        print(f"📂 Delta state: {self.state_dir}")
+        print(f"   Snapshot: {len(self.previous)} subsidiaries, {rows} rows")
+        for fp in file_paths:
+            entry = self.index.get(os.path.abspath(fp))
+            if entry:
+                print(f"   {os.path.basename(fp)}: {entry.get('status')} | "
+                      f"subsidiary '{entry.get('subsidiary_found')}' -> {entry.get('partition')}")
+            else:
+                print(f"   {os.path.basename(fp)}: no history")
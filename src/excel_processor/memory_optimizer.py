@@ -1,13 +1,21 @@
 # excel_processor/memory_optimizer.py
-import gc
-import psutil
-import xlwings as xw
-from typing import Optional
+from __future__ import annotations
+import gc, functools, threading, tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import xlwings as xw
+    from .models import ProcessingConfig, ProcessingResult
+    from .supervisor import ProcessSupervisor
+
+MB = 1024 * 1024
 
 class MemoryOptimizer:
     @staticmethod
     def get_memory_usage() -> float:
         """Get current memory usage in MB"""
+        import psutil
         process = psutil.Process()
         return process.memory_info().rss / 1024 / 1024
     
@@ -40,7 +48,12 @@ class MemoryOptimizer:
     def monitor_memory_usage(operation_name: str):
         """Decorator to monitor memory usage of operations"""
         def decorator(func):
+            @functools.wraps(func)
             def wrapper(*args, **kwargs):
+                profiler = MemoryProfiler.active()
+                if profiler:
+                    with profiler.phase(operation_name):
+                        return func(*args, **kwargs)
                 start_memory = MemoryOptimizer.get_memory_usage()
                 result = func(*args, **kwargs)
                 end_memory = MemoryOptimizer.get_memory_usage()
@@ -48,4 +61,194 @@ class MemoryOptimizer:
                 print(f"   📊 {operation_name}: {memory_delta:+.1f}MB (now {end_memory:.1f}MB)")
                 return result
             return wrapper
-        return decorator
\ No newline at end of file
+        return decorator
+
+class MemoryProfiler:
+    """Opt-in memory profiling for a batch run.
+
+    A background thread samples RSS of this process plus the backend processes
+    (supervised Excel instances and our own children) to catch the real peak,
+    per file and for the run. ``phase()`` wraps a processing phase with
+    tracemalloc so the report can show which phase allocates most and where.
+    tracemalloc is process-wide, so phase numbers are exact in sequential mode
+    and an upper bound when files overlap.
+    """
+    _active: Optional["MemoryProfiler"] = None
+
+    def __init__(self, supervisor: Optional[ProcessSupervisor] = None,
+                 interval: float = 0.05, top_sites: int = 5):
+        self.supervisor = supervisor
+        self.interval = interval
+        self.top_sites = top_sites
+        self.peak_own_mb = 0.0
+        self.peak_total_mb = 0.0
+        self._windows: Dict[int, dict] = {}
+        self._phase_peak: Dict[str, float] = {}
+        self._phase_runs: Dict[str, int] = {}
+        self._phase_sites: Dict[str, Dict[str, int]] = {}
+        self._active_phases = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._proc = None
+        self._owns_tracemalloc = False
+
+    @classmethod
+    def from_config(cls, config: ProcessingConfig,
+                    supervisor: Optional[ProcessSupervisor] = None) -> "MemoryProfiler":
+        return cls(supervisor=supervisor, interval=config.memory_sample_interval,
+                   top_sites=config.memory_top_sites)
+
+    @classmethod
+    def active(cls) -> Optional["MemoryProfiler"]:
+        return cls._active
+
+    # ---------- lifecycle ----------
+    def start(self):
+        import psutil
+        if self._thread and self._thread.is_alive():
+            return
+        self._proc = psutil.Process()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="memory-profiler", daemon=True)
+        self._thread.start()
+        MemoryProfiler._active = self
+
+    def start_tracing(self):
+        """Start tracemalloc; call once imports and the summary are loaded.
+
+        Snapshot cost grows with the number of live traces, so tracing from
+        interpreter start (pandas, openpyxl) would dominate the run.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+        self._thread = None
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+        if MemoryProfiler._active is self:
+            MemoryProfiler._active = None
+
+    # ---------- RSS sampling ----------
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    @staticmethod
+    def _rss_mb(pid: int) -> float:
+        import psutil
+        try:
+            return psutil.Process(pid).memory_info().rss / MB
+        except psutil.Error:
+            return 0.0
+
+    def sample(self):
+        if self._proc is None:
+            return
+        own = self._proc.memory_info().rss / MB
+        pids = set(self.supervisor.active_pids()) if self.supervisor else set()
+        try:
+            pids |= {c.pid for c in self._proc.children(recursive=True)}
+        except Exception:
+            pass
+        backend = {pid: self._rss_mb(pid) for pid in pids}
+        with self._lock:
+            self.peak_own_mb = max(self.peak_own_mb, own)
+            self.peak_total_mb = max(self.peak_total_mb, own + sum(backend.values()))
+            for w in self._windows.values():
+                w['peak'] = max(w['peak'], own + backend.get(w['pid'], 0.0))
+
+    def begin_file(self, result: ProcessingResult):
+        own = self._proc.memory_info().rss / MB if self._proc else 0.0
+        with self._lock:
+            self._windows[id(result)] = {'start': own, 'peak': own, 'pid': None}
+
+    def attach_pid(self, result: ProcessingResult, pid: Optional[int]):
+        """Count this file's backend process towards its own peak."""
+        with self._lock:
+            w = self._windows.get(id(result))
+            if w is not None:
+                w['pid'] = pid
+        self.sample()
+
+    def end_file(self, result: ProcessingResult):
+        self.sample()
+        with self._lock:
+            w = self._windows.pop(id(result), None)
+        if w:
+            result.memory_peak_mb = round(w['peak'], 1)
+            result.memory_used_mb = round(w['peak'] - w['start'], 1)
+
+    # ---------- tracemalloc phases ----------
+    @contextmanager
+    def phase(self, name: str, result: Optional[ProcessingResult] = None):
+        if not tracemalloc.is_tracing():
+            yield
+            return
+        with self._lock:
+            if self._active_phases == 0:
+                tracemalloc.reset_peak()
+            self._active_phases += 1
+        start_current = tracemalloc.get_traced_memory()[0]
+        before = self._snapshot() if self.top_sites else None
+        try:
+            yield
+        finally:
+            peak = tracemalloc.get_traced_memory()[1]
+            after = self._snapshot() if before is not None else None
+            peak_mb = max(0, peak - start_current) / MB
+            with self._lock:
+                self._active_phases -= 1
+                self._phase_peak[name] = max(self._phase_peak.get(name, 0.0), peak_mb)
+                self._phase_runs[name] = self._phase_runs.get(name, 0) + 1
+                if after is not None:
+                    sites = self._phase_sites.setdefault(name, {})
+                    for stat in after.compare_to(before, 'lineno')[:self.top_sites * 4]:
+                        site = str(stat.traceback[0])
+                        # filtering the snapshot itself is far slower than skipping here
+                        if stat.size_diff > 0 and not site.startswith(tracemalloc.__file__):
+                            sites[site] = sites.get(site, 0) + stat.size_diff
+            if result is not None:
+                result.memory_phases[name] = round(max(result.memory_phases.get(name, 0.0), peak_mb), 1)
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot()
+
+    # ---------- process-pool workers ----------
+    def export(self) -> Dict[str, object]:
+        """Cumulative peaks and phase data, picklable for the parent process."""
+        with self._lock:
+            return {'peak_own_mb': self.peak_own_mb, 'peak_total_mb': self.peak_total_mb,
+                    'phase_peak': dict(self._phase_peak), 'phase_runs': dict(self._phase_runs),
+                    'phase_sites': {k: dict(v) for k, v in self._phase_sites.items()}}
+
+    def merge(self, exported: Dict[str, object]):
+        """Fold one worker's final export into this (parent) profile."""
+        with self._lock:
+            self.peak_own_mb = max(self.peak_own_mb, exported['peak_own_mb'])
+            self.peak_total_mb = max(self.peak_total_mb, exported['peak_total_mb'])
+            for name, peak in exported['phase_peak'].items():
+                self._phase_peak[name] = max(self._phase_peak.get(name, 0.0), peak)
+            for name, runs in exported['phase_runs'].items():
+                self._phase_runs[name] = self._phase_runs.get(name, 0) + runs
+            for name, sites in exported['phase_sites'].items():
+                mine = self._phase_sites.setdefault(name, {})
+                for site, size in sites.items():
+                    mine[site] = mine.get(site, 0) + size
+
+    # ---------- reporting ----------
+    def print_report(self):
+        print("\n🧮 MEMORY PROFILE")
+        print(f"   📈 Peak RSS: {self.peak_own_mb:.1f}MB own | {self.peak_total_mb:.1f}MB incl. Excel")
+        for name, peak in sorted(self._phase_peak.items(), key=lambda kv: -kv[1]):
+            print(f"   {name:<8} traced peak {peak:8.1f}MB over {self._phase_runs.get(name, 0)} run(s)")
+            sites = sorted(self._phase_sites.get(name, {}).items(), key=lambda kv: -kv[1])
+            for site, size in sites[:self.top_sites]:
+                print(f"      {size / MB:8.2f}MB  {site}")
@@ -1,6 +1,6 @@
 # excel_processor/models.py
 from dataclasses import dataclass, field
-from typing import Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 @dataclass
 class ProcessingConfig:
@@ -10,8 +10,31 @@ class ProcessingConfig:
     timeout_seconds: int = 300
     backup_enabled: bool = True
     retry_attempts: int = 2
+    call_retry_attempts: int = 3
+    retry_base_delay: float = 0.25
+    retry_max_delay: float = 8.0
+    breaker_threshold: int = 5
+    breaker_cooldown: float = 30.0
+    session_memory_limit_mb: float = 4096.0  # 0 disables; wall clock uses timeout_seconds
+    supervisor_poll_interval: float = 1.0
+    partition_cache_size: int = 32
+    memory_profiling: bool = False
+    memory_sample_interval: float = 0.05
+    memory_top_sites: int = 5
+    cpu_profile: Optional[str] = None  # 'det' (cProfile) | 'sample' (stack sampler); None = off
+    cpu_profile_dir: str = ""          # per-file dumps; default ./profiles
+    cpu_sample_interval: float = 0.005
+    cpu_profile_top: int = 25
+    change_log_path: str = ""          # per-cell change CSV; empty = off
     excel_startup_delay: float = 1.0
     column_mapping: Dict[str, str] = field(default_factory=dict)
+    pipeline_queue_depth: int = 2
+    prefetch_chunk_mb: int = 4
+    summary_engine: Optional[str] = None  # None = fastest installed reader
+    watch_debounce: float = 2.0       # quiet seconds after the last save before a file syncs
+    watch_poll_interval: float = 1.0  # folder scan period when no native watcher is installed
+    warm_sessions: int = 1            # idle Excel instances kept open in watch mode
+    session_max_uses: int = 50        # recycle a warm instance after this many files
 
 @dataclass
 class ProcessingResult:
@@ -20,7 +43,101 @@ class ProcessingResult:
     rows_updated: int = 0
     rows_added: int = 0
     processing_time: float = 0.0
-    memory_used_mb: float = 0.0
+    memory_used_mb: float = 0.0    # peak RSS (ours + this file's Excel) above RSS at file start
+    memory_peak_mb: float = 0.0
+    memory_phases: Dict[str, float] = field(default_factory=dict)  # phase -> traced peak MB
     error_message: str = ""
     subsidiary_found: str = ""
     summary_matches: int = 0
+    failure_kind: str = ""
+    attempts: int = 1
+
+@dataclass
+class FileSession:
+    """State of one workbook as it moves through read -> match -> write."""
+    filepath: str
+    result: ProcessingResult
+    started: float = 0.0
+    app: Any = None
+    wb: Any = None
+    sheet: Any = None
+    header_row: Optional[int] = None
+    headers: List[str] = field(default_factory=list)
+    df: Any = None
+    summary_subset: Any = None
+    prepared: Any = None  # PreparedPartition
+    write_pairs: List[Tuple[int, List]] = field(default_factory=list)
+    fill_pairs: List[Tuple[int, List]] = field(default_factory=list)
+    changes: List[Tuple] = field(default_factory=list)  # changelog.CellChange, kept only when logging
+    active: bool = True
+    excel_slot: bool = False
+    pid: Optional[int] = None
+
+@dataclass
+class SupervisedProcess:
+    pid: int
+    label: str
+    started: float          # time.monotonic() at registration
+    create_time: float      # guards against PID reuse
+    owner: int              # thread ident that registered the process
+    popen: Any = None
+    parked: bool = False    # idle warm session: wall-clock limit paused
+
+@dataclass
+class WorkerStats:
+    pid: int
+    start_latency: float = 0.0   # pool start -> worker ready, seconds
+    attach_ms: float = 0.0       # mapping the shared summary + building the processor
+    ready_rss_mb: float = 0.0
+    peak_rss_mb: float = 0.0
+    files: int = 0
+    cache: Dict[str, float] = field(default_factory=dict)   # worker's cumulative partition cache stats
+    memory: Optional[Dict[str, Any]] = None                  # MemoryProfiler.export() with --memory-profile
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    busy_time: float = 0.0
+    wait_in_time: float = 0.0
+    wait_out_time: float = 0.0
+    slot_wait_time: float = 0.0    # blocked on the Excel session cap, not working
+    queue_samples: int = 0
+    queue_depth_total: int = 0
+    queue_depth_max: int = 0
+
+    def sample_queue(self, depth: int):
+        self.queue_samples += 1
+        self.queue_depth_total += depth
+        self.queue_depth_max = max(self.queue_depth_max, depth)
+
+    @property
+    def avg_queue_depth(self) -> float:
+        return self.queue_depth_total / self.queue_samples if self.queue_samples else 0.0
+
+@dataclass
+class PreparedPartition:
+    """Per-subsidiary match state, reusable by every file that maps to it."""
+    subset: Any                                   # summary rows for the subsidiary
+    key1: List[str] = field(default_factory=list)  # Unit name|Tenant ID per row
+    key2: List[str] = field(default_factory=list)  # Unit name|Tenant per row
+    index1: Dict[str, int] = field(default_factory=dict)  # key1 -> first row position
+    index2: Dict[str, int] = field(default_factory=dict)
+    projected: List[Dict[str, Any]] = field(default_factory=list)  # target column -> summary value
+
+@dataclass
+class SubsidiaryChange:
+    subsidiary: str
+    added: int = 0
+    removed: int = 0
+    changed: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.added + self.removed + self.changed
+
+@dataclass
+class DeltaPlan:
+    changes: Dict[str, SubsidiaryChange] = field(default_factory=dict)
+    selected: Dict[str, str] = field(default_factory=dict)  # filepath -> reason
+    skipped: Dict[str, str] = field(default_factory=dict)   # filepath -> reason
@@ -0,0 +1,208 @@
+# excel_processor/pipeline.py
+from __future__ import annotations
+import os, time, queue, threading
+from typing import Callable, List, Optional, Tuple, TYPE_CHECKING
+
+from .models import ProcessingConfig, ProcessingResult, FileSession, StageStats
+from .com_management import COMManager
+from .retry import FailureKind, RetryPolicy
+
+if TYPE_CHECKING:
+    from .processor import EnhancedExcelProcessor
+
+_DONE = object()
+
+class StagedPipeline:
+    """prefetch -> read/parse -> match -> write/save, joined by bounded queues.
+
+    Every stage owns one thread, so the cold read and Excel open of file N+1
+    overlap the pandas matching and the save of file N. Open Excel sessions
+    are capped at ``max_excel_instances`` regardless of queue depth.
+    Outcomes feed the retry policy's circuit breaker; retryable failures
+    get their remaining attempts sequentially once the pipeline drains.
+    """
+
+    def __init__(self, config: ProcessingConfig, processor: EnhancedExcelProcessor,
+                 retry_policy: Optional[RetryPolicy] = None):
+        self.config = config
+        self.processor = processor
+        self.retry_policy = retry_policy or processor.retry_policy
+        self.stats: List[StageStats] = []
+        self.wall_time = 0.0
+        self._excel_slots = threading.BoundedSemaphore(max(1, config.max_excel_instances))
+
+    def run(self, file_paths: List[str]) -> List[ProcessingResult]:
+        depth = max(1, self.config.pipeline_queue_depth)
+        discovered: queue.Queue = queue.Queue()
+        prefetched: queue.Queue = queue.Queue(maxsize=depth)
+        parsed: queue.Queue = queue.Queue(maxsize=depth)
+        matched: queue.Queue = queue.Queue(maxsize=depth)
+        finished: queue.Queue = queue.Queue()
+
+        sessions = [FileSession(filepath=fp, result=ProcessingResult(filepath=fp, status='error'))
+                    for fp in file_paths]
+        for s in sessions:
+            discovered.put(s)
+        discovered.put(_DONE)
+
+        Handler = Callable[[FileSession], bool]
+        stages: List[Tuple[str, queue.Queue, queue.Queue, Handler, bool, Optional[Handler]]] = [
+            ("prefetch", discovered, prefetched, self._prefetch, False, None),
+            ("read",     prefetched, parsed,     self._read,     True,  self._acquire_slot),
+            ("match",    parsed,     matched,    self._match,    False, None),
+            ("write",    matched,    finished,   self._write,    True,  None),
+        ]
+        self.stats = [StageStats(name=name) for name, *_ in stages]
+
+        t0 = time.perf_counter()
+        threads = []
+        for stats, (name, inbox, outbox, handler, uses_com, gate) in zip(self.stats, stages):
+            t = threading.Thread(target=self._run_stage, name=f"pipeline-{name}",
+                                 args=(stats, inbox, outbox, handler, uses_com, gate), daemon=True)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        self.wall_time = time.perf_counter() - t0
+
+        self._retry_failures(sessions)
+        return [s.result for s in sessions]
+
+    def _retry_failures(self, sessions: List[FileSession]):
+        """Give retryable failures their remaining attempts, one file at a time."""
+        policy = self.retry_policy
+        retry = [s for s in sessions if s.started and s.result.status != 'success'
+                 and FailureKind.is_retryable(s.result.failure_kind)]
+        if not retry or policy.attempts < 2 or (policy.breaker and policy.breaker.is_open):
+            return
+        print(f"\n🔄 Retrying {len(retry)} failed file(s) outside the pipeline")
+        supervisor = self.processor.supervisor
+        for s in retry:
+            if supervisor:
+                supervisor.sweep_orphans()  # all stage threads are done; anything left is a leftover
+            time.sleep(policy.backoff(0))
+            s.result = policy.run_file(
+                s.filepath,
+                lambda fp=s.filepath: self.processor.process_single_file_enhanced(fp),
+                reset_backend=supervisor.sweep_orphans if supervisor else None,
+                first_attempt=1,
+            )
+
+    # ---------- stage plumbing ----------
+    def _run_stage(self, stats: StageStats, inbox: queue.Queue, outbox: queue.Queue,
+                   handler: Callable[[FileSession], bool], uses_com: bool,
+                   gate: Optional[Callable[[FileSession], bool]] = None):
+        if uses_com:
+            COMManager.initialize_com(multithreaded=True)
+        try:
+            while True:
+                t = time.perf_counter()
+                item = inbox.get()
+                stats.wait_in_time += time.perf_counter() - t
+                if item is _DONE:
+                    outbox.put(_DONE)
+                    break
+                stats.sample_queue(inbox.qsize())
+
+                session: FileSession = item
+                if session.active and gate:
+                    # waiting for a resource is not stage work; keep it out of busy/util
+                    t = time.perf_counter()
+                    if not gate(session):
+                        self._finish(session)
+                    stats.slot_wait_time += time.perf_counter() - t
+                if session.active:
+                    t = time.perf_counter()
+                    try:
+                        if not handler(session):
+                            self._finish(session)
+                    except Exception as e:
+                        self.processor.record_failure(session, e)
+                        print(f"   ❌ [{stats.name}] {os.path.basename(session.filepath)}: "
+                              f"{session.result.error_message}")
+                        self._finish(session)
+                    stats.busy_time += time.perf_counter() - t
+                    stats.items += 1
+
+                t = time.perf_counter()
+                outbox.put(session)
+                stats.wait_out_time += time.perf_counter() - t
+        finally:
+            if uses_com:
+                COMManager.cleanup_com()
+
+    def _finish(self, session: FileSession):
+        if not session.active:
+            return
+        session.active = False
+        self.processor.close_session(session)
+        if session.excel_slot:
+            session.excel_slot = False
+            self._excel_slots.release()
+        if session.started and not session.result.processing_time:
+            session.result.processing_time = time.time() - session.started
+        if self.processor.profiler and session.started:
+            self.processor.profiler.end_file(session.result)
+        if self.processor.cpu_profiler and session.started:
+            self.processor.cpu_profiler.end_file(session.filepath)
+        result = session.result
+        if session.started:
+            if result.status != 'success':
+                result.failure_kind = result.failure_kind or FailureKind.classify(result.error_message)
+            if self.retry_policy.breaker:
+                self.retry_policy.breaker.record("" if result.status == 'success' else result.failure_kind)
+
+    # ---------- stage handlers ----------
+    def _prefetch(self, session: FileSession) -> bool:
+        """Stream the file once so Excel's open is served from the OS cache."""
+        buf = bytearray(max(1, self.config.prefetch_chunk_mb) * 1024 * 1024)
+        with open(session.filepath, 'rb', buffering=0) as f:
+            while f.readinto(buf):
+                pass
+        return True
+
+    def _acquire_slot(self, session: FileSession) -> bool:
+        """Take one of the ``max_excel_instances`` Excel slots, unless the breaker is open."""
+        breaker = self.retry_policy.breaker
+        if breaker and not breaker.allow():
+            session.result.error_message = "Circuit open: Excel backend keeps failing"
+            session.result.failure_kind = FailureKind.CIRCUIT_OPEN
+            print(f"   🔌 Skipping {os.path.basename(session.filepath)}: circuit open")
+            return False
+        self._excel_slots.acquire()
+        session.excel_slot = True
+        return True
+
+    def _read(self, session: FileSession) -> bool:
+        session.started = time.time()
+        if self.processor.profiler:
+            self.processor.profiler.begin_file(session.result)
+        print(f"\n🔄 Processing: {session.filepath}")
+        return self.processor.run_stage("read", session, self.processor.read_stage)
+
+    def _match(self, session: FileSession) -> bool:
+        return self.processor.run_stage("match", session, self.processor.match_stage)
+
+    def _write(self, session: FileSession) -> bool:
+        try:
+            return self.processor.run_stage("write", session, self.processor.write_stage)
+        finally:
+            self._finish(session)
+
+    # ---------- reporting ----------
+    def print_report(self):
+        print("\n🧵 PIPELINE STAGE REPORT")
+        print(f"   ⏱️ Wall time: {self.wall_time:.1f}s")
+        for st in self.stats:
+            util = st.busy_time / self.wall_time * 100 if self.wall_time else 0.0
+            slot = f"slot_wait={st.slot_wait_time:6.1f}s " if st.slot_wait_time else ""
+            print(f"   {st.name:<9} items={st.items:<4} busy={st.busy_time:6.1f}s util={util:5.1f}% "
+                  f"wait_in={st.wait_in_time:6.1f}s blocked_out={st.wait_out_time:6.1f}s {slot}"
+                  f"queue avg={st.avg_queue_depth:.1f} max={st.queue_depth_max}")
+        bottleneck: Optional[StageStats] = max(self.stats, key=lambda s: s.busy_time, default=None)
+        if bottleneck and bottleneck.busy_time > 0:
+            print(f"   🎯 Bottleneck stage: {bottleneck.name}")
+        capped = max(self.stats, key=lambda s: s.slot_wait_time, default=None)
+        if capped and bottleneck and capped.slot_wait_time > bottleneck.busy_time:
+            print(f"   🔧 {capped.name} spent longer waiting for an Excel slot than any stage worked: "
+                  f"raise max_excel_instances")
@@ -1,154 +1,441 @@
 # excel_processor/processor.py
-import time
+from __future__ import annotations
+import gc, math, time, threading
+from collections import OrderedDict
 import pandas as pd
-import xlwings as xw
-from typing import List, Tuple, Optional, Dict
+from typing import Callable, List, Tuple, Optional, Dict, Set, TYPE_CHECKING
 
-from .models import ProcessingConfig, ProcessingResult
+from .models import ProcessingConfig, ProcessingResult, FileSession, PreparedPartition
+from .config import SUMMARY_KEY_COLUMNS
 from .com_management import COMManager, EnhancedExcelOptimizer
 from .subsidiary import SubsidiaryExtractor
 from .memory_optimizer import MemoryOptimizer
+from .retry import FailureKind, RetryPolicy
+
+if TYPE_CHECKING:
+    import xlwings as xw
+    from .supervisor import ProcessSupervisor
+    from .memory_optimizer import MemoryProfiler
+    from .cpu_profiler import CpuProfiler
+    from .changelog import ChangeLogWriter, CellChange
+    from .shared_summary import SharedSummaryView
+    from .com_management import ExcelSessionPool
 
 class EnhancedExcelProcessor:
-    def __init__(self, config: ProcessingConfig):
+    def __init__(self, config: ProcessingConfig, supervisor: Optional[ProcessSupervisor] = None,
+                 profiler: Optional[MemoryProfiler] = None, cpu_profiler: Optional[CpuProfiler] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
         self.config = config
+        self.supervisor = supervisor
+        self.retry_policy = retry_policy or RetryPolicy.from_config(config)  # file and COM-call retries
+        self.profiler = profiler
+        self.cpu_profiler = cpu_profiler
+        self.change_log: Optional[ChangeLogWriter] = None
         self.summary_data: Optional[pd.DataFrame] = None
         self.summary_lookup: Dict[str, tuple] = {}
-        self.subsidiary_variations: Dict[str, str] = {}
+        self.summary_load_info: Dict[str, object] = {}
+        self.summary_version = 0
+        self.summary_view: Optional[SharedSummaryView] = None
+        self.subsidiary_names: List[str] = []
+        self.session_pool: Optional[ExcelSessionPool] = None  # warm Excel reuse (watch mode)
+        self._partition_cache: "OrderedDict[tuple, PreparedPartition]" = OrderedDict()
+        self._partition_lock = threading.Lock()
+        self.partition_cache_hits = 0
+        self.partition_cache_misses = 0
 
     # ---------- SUMMARY ----------
+    def summary_columns(self) -> List[str]:
+        """Only the columns matching and writing ever touch, in a stable order."""
+        cols = list(SUMMARY_KEY_COLUMNS)
+        cols += [c for c in self.config.column_mapping if c not in cols]
+        return cols
+
+    def _pick_summary_engine(self, summary_path: str) -> Optional[str]:
+        if self.config.summary_engine:
+            return self.config.summary_engine
+        try:
+            import python_calamine  # noqa: F401  (Rust reader, pandas >= 2.2)
+            return 'calamine'
+        except ImportError:
+            pass
+        if summary_path.lower().endswith('.xlsb'):
+            return 'pyxlsb'
+        return None
+
     def load_summary_data_enhanced(self, summary_path: str):
         print("📊 Loading and analyzing summary data...")
-        self.summary_data = pd.read_excel(summary_path, dtype=str).fillna('')
+        t0 = time.perf_counter()
+        start_memory = MemoryOptimizer.get_memory_usage()
+
+        wanted = set(self.summary_columns())
+        seen: List[str] = []
+        def _keep(col) -> bool:
+            seen.append(col)
+            return col in wanted
+
+        engine = self._pick_summary_engine(summary_path)
+        frame = pd.read_excel(summary_path, dtype=str, usecols=_keep, engine=engine)
+
+        missing_keys = [c for c in SUMMARY_KEY_COLUMNS if c not in frame.columns]
+        if missing_keys:
+            raise ValueError(f"Summary file is missing required columns {missing_keys}. "
+                             f"Available: {seen}")
+        missing_mapped = [c for c in self.config.column_mapping if c not in frame.columns]
+        if missing_mapped:
+            print(f"   ⚠️ Summary has no column for mapped fields: {missing_mapped}")
+
+        self.summary_data = frame.fillna('')
+        self.summary_version += 1  # invalidates every cached partition
 
-        subsidiaries = self.summary_data['Subsidiary'].unique()
-        for sub in subsidiaries:
-            if pd.notna(sub) and sub.strip():
-                clean = sub.strip().upper()
-                self.subsidiary_variations[clean] = sub
-                if '-' in clean:
-                    self.subsidiary_variations[clean.split('-')[0].strip()] = sub
+        self.summary_view = None
+        self.subsidiary_names = list(self.summary_data['Subsidiary'].unique())
 
         self.summary_lookup = {}
-        for idx, row in self.summary_data.iterrows():
-            k1 = f"{row['Unit name'].strip()}|{row['Tenant ID'].strip()}"
-            k2 = f"{row['Unit name'].strip()}|{row['Tenant'].strip()}"
-            self.summary_lookup[k1] = (idx, row.to_dict())
-            self.summary_lookup[k2] = (idx, row.to_dict())
+        unit = self.summary_data['Unit name'].str.strip()
+        k1s = unit + '|' + self.summary_data['Tenant ID'].str.strip()
+        k2s = unit + '|' + self.summary_data['Tenant'].str.strip()
+        records = self.summary_data.to_dict('records')
+        for idx, k1, k2, rec in zip(self.summary_data.index, k1s, k2s, records):
+            self.summary_lookup[k1] = (idx, rec)
+            self.summary_lookup[k2] = (idx, rec)
+
+        load_time = time.perf_counter() - t0
+        frame_mb = self.summary_data.memory_usage(deep=True).sum() / 1024 / 1024
+        rss_delta = MemoryOptimizer.get_memory_usage() - start_memory
+        self.summary_load_info = {
+            'engine': engine or 'default',
+            'load_time': load_time,
+            'columns_read': len(self.summary_data.columns),
+            'columns_total': len(seen),
+            'frame_mb': frame_mb,
+            'rss_delta_mb': rss_delta,
+        }
 
         print(f"   ✅ Loaded {len(self.summary_data)} summary records")
         print(f"   ✅ Created {len(self.summary_lookup)} lookup keys")
+        print(f"   ⏱️ Summary load {load_time:.2f}s via {engine or 'default'} engine | "
+              f"{len(self.summary_data.columns)}/{len(seen)} columns | "
+              f"frame {frame_mb:.1f}MB | RSS {rss_delta:+.1f}MB")
+
+    def attach_summary_view(self, view: SharedSummaryView):
+        """Serve summary rows from a shared, memory-mapped summary instead of a local frame."""
+        self.summary_view = view
+        self.summary_data = None
+        self.subsidiary_names = list(view.subsidiaries)
+        self.summary_version += 1
+
+    def resolve_subsidiary_names(self, extracted_subsidiary: str) -> List[str]:
+        """Summary 'Subsidiary' values for a file (same resolver the delta tracker uses)."""
+        return SubsidiaryExtractor.match_summary_names(extracted_subsidiary, self.subsidiary_names, verbose=True)
 
     def get_subsidiary_subset(self, extracted_subsidiary: str) -> pd.DataFrame:
         if not extracted_subsidiary:
-            return self.summary_data
+            names = None
+        else:
+            names = self.resolve_subsidiary_names(extracted_subsidiary)
+            if not names:
+                return pd.DataFrame()
+        if self.summary_view is not None:
+            return self.summary_view.rows_for(names)
         ss = self.summary_data
-        exact = ss[ss['Subsidiary'].astype(str).str.strip().str.upper() == extracted_subsidiary.upper()]
-        if not exact.empty:
-            return exact
-        for var, original in self.subsidiary_variations.items():
-            if var == extracted_subsidiary.upper():
-                m = ss[ss['Subsidiary'].astype(str).str.strip() == original]
-                if not m.empty:
-                    print(f"   🔄 Matched {extracted_subsidiary} -> {original}")
-                    return m
-        partial = ss[ss['Subsidiary'].astype(str).str.contains(extracted_subsidiary, case=False, na=False)]
-        if not partial.empty:
-            print(f"   🔍 Partial match for {extracted_subsidiary}")
-            return partial
-        print(f"   ⚠️ No subsidiary match for '{extracted_subsidiary}'")
-        return pd.DataFrame()
+        if names is None:
+            return ss
+        return ss[ss['Subsidiary'].astype(str).isin(names)]
+
+    def get_prepared_partition(self, extracted_subsidiary: str) -> PreparedPartition:
+        """LRU-cached subset + keys + hash indexes + projected rows for one subsidiary.
+
+        Keyed by (subsidiary, summary_version), shared by all worker threads.
+        """
+        key = (extracted_subsidiary.strip().upper(), self.summary_version)
+        with self._partition_lock:
+            prepared = self._partition_cache.get(key)
+            if prepared is not None:
+                self._partition_cache.move_to_end(key)
+                self.partition_cache_hits += 1
+                return prepared
+            self.partition_cache_misses += 1
+            # built under the lock: a few ms of pandas, and concurrent files of
+            # the same subsidiary then wait for one build instead of repeating it
+            prepared = self._prepare_partition(self.get_subsidiary_subset(extracted_subsidiary))
+            self._partition_cache[key] = prepared
+            self._partition_cache.move_to_end(key)
+            while len(self._partition_cache) > max(1, self.config.partition_cache_size):
+                self._partition_cache.popitem(last=False)
+        return prepared
+
+    def _prepare_partition(self, subset: pd.DataFrame) -> PreparedPartition:
+        prepared = PreparedPartition(subset=subset)
+        if subset.empty:
+            return prepared
+        unit = subset['Unit name'].astype(str).str.strip()
+        prepared.key1 = (unit + '|' + subset['Tenant ID'].astype(str).str.strip()).tolist()
+        prepared.key2 = (unit + '|' + subset['Tenant'].astype(str).str.strip()).tolist()
+        for pos, (k1, k2) in enumerate(zip(prepared.key1, prepared.key2)):
+            prepared.index1.setdefault(k1, pos)
+            prepared.index2.setdefault(k2, pos)
+
+        # first source column per target, as the per-row lookup used to pick it
+        sources: Dict[str, str] = {}
+        for src, tgt in self.config.column_mapping.items():
+            sources.setdefault(tgt, src)
+        cols = [(tgt, src) for tgt, src in sources.items() if src in subset.columns]
+        for rec in subset.to_dict('records'):
+            proj = {}
+            for tgt, src in cols:
+                cand = rec[src]
+                if pd.notna(cand) and str(cand).strip() not in ['', '- None -']:
+                    proj[tgt] = cand
+            prepared.projected.append(proj)
+        return prepared
+
+    def refresh_summary(self, summary_path: str, find_changed: Callable[[pd.DataFrame], Set[str]]) -> Set[str]:
+        """Reload the summary and rebuild every partition that was cached, so the next sync starts warm.
+
+        ``find_changed`` gets the freshly loaded frame and returns the changed
+        subsidiary names, which are returned as well. Partitions are rebuilt
+        from the new frame rather than carried over: old subsets hold the old
+        row labels, and whitespace in raw 'Subsidiary' values makes matching
+        them against snapshot names unreliable.
+        """
+        with self._partition_lock:
+            codes = [code for code, version in self._partition_cache if version == self.summary_version]
+        self.load_summary_data_enhanced(summary_path)
+        changed = set(find_changed(self.summary_data))
+        for code in codes:
+            self.get_prepared_partition(code)
+        print(f"   🧠 Rebuilt {len(codes)} prepared partition(s) against the new summary")
+        return changed
+
+    def cache_stats(self) -> Dict[str, float]:
+        with self._partition_lock:
+            total = self.partition_cache_hits + self.partition_cache_misses
+            return {
+                'hits': self.partition_cache_hits,
+                'misses': self.partition_cache_misses,
+                'size': len(self._partition_cache),
+                'hit_rate': self.partition_cache_hits / total if total else 0.0,
+            }
 
     # ---------- CORE PER-FILE ----------
     def process_single_file_enhanced(self, filepath: str) -> ProcessingResult:
-        start = time.time()
         result = ProcessingResult(filepath=filepath, status='error')
-
-        app: Optional[xw.App] = None
-        wb = None
+        if not COMManager.initialize_com():
+            result.error_message = "COM initialization failed"
+            result.failure_kind = FailureKind.EXCEL_CRASH
+            return result
+
+        session = FileSession(filepath=filepath, result=result, started=time.time())
+        if self.profiler:
+            self.profiler.begin_file(result)
         try:
-            if not COMManager.initialize_com():
-                result.error_message = "COM initialization failed"
-                return result
-
             print(f"\n🔄 Processing: {filepath}")
-            app = EnhancedExcelOptimizer.setup_excel_app_robust()
-            if not app:
-                result.error_message = "Could not initialize Excel application"
-                return result
-
-            wb = EnhancedExcelOptimizer.safe_excel_operation(lambda: app.books.open(filepath))
-            
-            # Apply memory optimizations for large files
-            MemoryOptimizer.optimize_workbook_for_large_files(wb)
-
-            # chọn sheet
-            try:
-                sheet = wb.sheets['1.Leasing income']
-            except Exception:
-                names = [s.name for s in wb.sheets]
-                candidates = [n for n in names if 'leasing' in n.lower() or 'income' in n.lower()]
-                if candidates:
-                    sheet = wb.sheets[candidates[0]]
-                    print(f"   📋 Using sheet: {candidates[0]}")
-                else:
-                    raise Exception(f"Leasing income sheet not found. Available: {names}")
-
-            header_row = EnhancedExcelOptimizer.find_header_row_enhanced(sheet)
-            if not header_row:
-                result.error_message = "Header row not found"
-                wb.close()
-                return result
-
-            subsidiary = SubsidiaryExtractor.extract_subsidiary_enhanced(sheet, filepath, header_row)
-            result.subsidiary_found = subsidiary
-
-            summary_subset = self.get_subsidiary_subset(subsidiary)
-            result.summary_matches = len(summary_subset)
-            if summary_subset.empty:
-                result.error_message = f"No summary data for subsidiary '{subsidiary}'"
-                wb.close()
-                return result
-
-            print("   📊 Reading sheet data...")
-            start_memory = MemoryOptimizer.get_memory_usage()
-            headers, data = self._batch_read_enhanced(sheet, header_row)
-            end_memory = MemoryOptimizer.get_memory_usage()
-            print(f"   📈 Data read completed: {end_memory - start_memory:+.1f}MB memory change")
-            if not data:
-                result.error_message = "No data rows found"
-                wb.close()
-                return result
-
-            df = pd.DataFrame(data, columns=headers).astype(object).fillna('')
-            rows_updated, rows_added = self._process_dataframe_enhanced(df, sheet, header_row, headers, summary_subset)
-
-            print("   💾 Saving workbook...")
-            wb.save()
-            wb.close()
-            MemoryOptimizer.cleanup_memory()
-
-            result.status = 'success'
-            result.rows_updated = rows_updated
-            result.rows_added = rows_added
-            result.processing_time = time.time() - start
-            print(f"   ✅ Success: {rows_updated} updated, {rows_added} added ({result.processing_time:.1f}s)")
-
+            if self.run_stage("read", session, self.read_stage):
+                self.run_stage("match", session, self.match_stage)
+                self.run_stage("write", session, self.write_stage)
         except Exception as e:
-            result.error_message = str(e)
-            print(f"   ❌ Error: {e}")
-            try:
-                if wb: wb.close()
-            except: pass
+            self.record_failure(session, e)
+            print(f"   ❌ Error: {result.error_message}")
         finally:
-            try:
-                if app: app.quit()
-            except Exception as e:
-                print(f"   ⚠️ Excel cleanup warning: {e}")
-            time.sleep(0.5)
+            self.close_session(session)
             COMManager.cleanup_com()
+            if self.profiler:
+                self.profiler.end_file(result)
+            if self.cpu_profiler:
+                self.cpu_profiler.end_file(filepath)
         return result
 
+    # ---------- STAGES (shared by the sequential path and the pipeline) ----------
+    def run_stage(self, name: str, session: FileSession, stage) -> bool:
+        """Run one stage, under the memory / CPU profilers when enabled."""
+        if self.cpu_profiler:
+            with self.cpu_profiler.stage(session.filepath):
+                return self._run_stage_measured(name, session, stage)
+        return self._run_stage_measured(name, session, stage)
+
+    def _run_stage_measured(self, name: str, session: FileSession, stage) -> bool:
+        if not self.profiler:
+            return stage(session)
+        with self.profiler.phase(name, session.result):
+            return stage(session)
+
+    def read_stage(self, session: FileSession) -> bool:
+        """Open the workbook, locate header/subsidiary and parse the data block.
+
+        Returns False when the file cannot go further; the reason is left on
+        ``session.result.error_message``.
+        """
+        result = session.result
+        if self.session_pool:
+            app = self.session_pool.acquire()
+        else:
+            app = EnhancedExcelOptimizer.setup_excel_app_robust(self.supervisor, self.retry_policy)
+        if not app:
+            result.error_message = "Could not initialize Excel application"
+            result.failure_kind = FailureKind.EXCEL_CRASH
+            return False
+        session.app = app
+        session.pid = getattr(app, 'pid', None)
+        if self.profiler:
+            self.profiler.attach_pid(result, session.pid)
+
+        session.wb = EnhancedExcelOptimizer.safe_excel_operation(lambda: app.books.open(session.filepath),
+                                                                   policy=self.retry_policy)
+        wb = session.wb
+
+        # Apply memory optimizations for large files
+        MemoryOptimizer.optimize_workbook_for_large_files(wb)
+
+        # chọn sheet
+        try:
+            sheet = wb.sheets['1.Leasing income']
+        except Exception:
+            names = [s.name for s in wb.sheets]
+            candidates = [n for n in names if 'leasing' in n.lower() or 'income' in n.lower()]
+            if candidates:
+                sheet = wb.sheets[candidates[0]]
+                print(f"   📋 Using sheet: {candidates[0]}")
+            else:
+                result.failure_kind = FailureKind.MISSING_SHEET
+                raise Exception(f"Leasing income sheet not found. Available: {names}")
+        session.sheet = sheet
+
+        header_row = EnhancedExcelOptimizer.find_header_row_enhanced(sheet, self.retry_policy)
+        if not header_row:
+            result.error_message = "Header row not found"
+            result.failure_kind = FailureKind.MISSING_HEADER
+            return False
+        session.header_row = header_row
+
+        subsidiary = SubsidiaryExtractor.extract_subsidiary_enhanced(sheet, session.filepath, header_row)
+        result.subsidiary_found = subsidiary
+
+        prepared = self.get_prepared_partition(subsidiary)
+        summary_subset = prepared.subset
+        result.summary_matches = len(summary_subset)
+        if summary_subset.empty:
+            result.error_message = f"No summary data for subsidiary '{subsidiary}'"
+            result.failure_kind = FailureKind.NO_SUBSIDIARY
+            return False
+        session.summary_subset = summary_subset
+        session.prepared = prepared
+
+        print("   📊 Reading sheet data...")
+        start_memory = MemoryOptimizer.get_memory_usage()
+        headers, data = self._batch_read_enhanced(sheet, header_row)
+        end_memory = MemoryOptimizer.get_memory_usage()
+        print(f"   📈 Data read completed: {end_memory - start_memory:+.1f}MB memory change")
+        if not data:
+            result.error_message = "No data rows found"
+            result.failure_kind = FailureKind.NO_DATA
+            return False
+
+        session.headers = headers
+        session.df = pd.DataFrame(data, columns=headers).astype(object).fillna('')
+        return True
+
+    def match_stage(self, session: FileSession) -> bool:
+        """Pure pandas work: decide which Excel rows get which values. No COM calls."""
+        sources: Optional[Dict[str, Dict[int, int]]] = {'update': {}, 'fill': {}} if self.change_log else None
+        session.write_pairs, session.fill_pairs = self._plan_dataframe_updates(
+            session.df, session.header_row, session.headers, session.summary_subset, session.prepared,
+            sources
+        )
+        if sources is not None:
+            session.changes = self._collect_changes(session, sources)
+        return True
+
+    def _collect_changes(self, session: FileSession, sources: Dict[str, Dict[int, int]]) -> List[CellChange]:
+        """Cells whose planned value differs from what the sheet holds, with their summary row."""
+        subset = session.prepared.subset
+        labels = subset.index
+        subs = subset['Subsidiary'].tolist()
+        tenants = subset['Tenant'].tolist()
+        old_rows = session.df.values
+        changes: List[CellChange] = []
+        for action, pairs in (("update", session.write_pairs), ("fill", session.fill_pairs)):
+            for excel_row, new_vals in pairs:
+                pos = sources[action][excel_row]  # a row can be both updated and filled
+                summary_row = int(labels[pos]) + 2  # summary header is row 1
+                old_vals = old_rows[excel_row - session.header_row - 1]
+                for col, old, new in zip(session.headers, old_vals, new_vals):
+                    if not self._same_value(old, new):
+                        changes.append((subs[pos], tenants[pos], excel_row, col, old, new, action, summary_row))
+        return changes
+
+    @staticmethod
+    def _same_value(old, new) -> bool:
+        """Sheet value vs planned value, ignoring how it is typed: Excel reads 1000.0, the summary has '1000'."""
+        if old == new:
+            return True
+        a, b = str(old).strip(), str(new).strip()
+        if a == b:
+            return True
+        try:
+            return math.isclose(float(a), float(b), rel_tol=1e-9, abs_tol=1e-12)
+        except ValueError:
+            return False
+
+    def write_stage(self, session: FileSession) -> bool:
+        result = session.result
+        width = len(session.headers)
+        rows_updated = self._write_row_pairs(session.sheet, session.write_pairs, width, "update")
+        if session.write_pairs:
+            print(f"   → Updated {rows_updated} existing rows with summary data")
+        rows_added = self._write_row_pairs(session.sheet, session.fill_pairs, width, "fill")
+        if session.fill_pairs:
+            print(f"   → Filled {rows_added} empty green rows")
+
+        print("   💾 Saving workbook...")
+        sheet_name = session.sheet.name
+        session.wb.save()
+        session.wb.close()
+        session.wb = None
+        MemoryOptimizer.cleanup_memory()
+        if self.change_log:
+            self.change_log.record(session.filepath, sheet_name, session.changes)
+            session.changes = []
+
+        result.status = 'success'
+        result.rows_updated = rows_updated
+        result.rows_added = rows_added
+        result.processing_time = time.time() - session.started
+        print(f"   ✅ Success: {rows_updated} updated, {rows_added} added ({result.processing_time:.1f}s)")
+        return True
+
+    def record_failure(self, session: FileSession, error: Exception):
+        """Store an exception on the result, preferring the supervisor's kill reason."""
+        result = session.result
+        reason = self.supervisor.kill_reason(session.pid) if self.supervisor else ""
+        if reason:
+            result.error_message = f"Excel session killed: {reason}"
+            result.failure_kind = FailureKind.SESSION_LIMIT
+        else:
+            result.error_message = str(error)
+            result.failure_kind = result.failure_kind or FailureKind.classify(error)
+
+    def close_session(self, session: FileSession):
+        """Close an unsaved workbook and quit its Excel instance, if still open."""
+        try:
+            if session.wb: session.wb.close()
+        except: pass
+        # Excel only exits once no COM proxy into it is alive
+        session.wb = None
+        session.sheet = None
+        app, session.app = session.app, None
+        if self.session_pool and app is not None:
+            kind = session.result.failure_kind
+            self.session_pool.release(app, healthy=not kind or kind in FailureKind.DATA)
+            return
+        try:
+            if app: app.quit()
+        except Exception as e:
+            print(f"   ⚠️ Excel cleanup warning: {e}")
+        app = None
+        gc.collect()
+        if self.supervisor:
+            self.supervisor.release(session.pid)
+
     # ---------- IO helpers ----------
     def _batch_read_enhanced(self, sheet: xw.Sheet, header_row: int) -> Tuple[List[str], List[List]]:
         # Optimized batch reading for large files - LIMITED TO ROWS 1-300, COLUMNS 1-40
@@ -158,8 +445,8 @@ class EnhancedExcelProcessor:
         max_col = 40
         
         try:
-            used = EnhancedExcelOptimizer.safe_excel_operation(lambda: sheet.used_range)
-            last_cell = EnhancedExcelOptimizer.safe_excel_operation(lambda: used.last_cell)
+            used = EnhancedExcelOptimizer.safe_excel_operation(lambda: sheet.used_range, policy=self.retry_policy)
+            last_cell = EnhancedExcelOptimizer.safe_excel_operation(lambda: used.last_cell, policy=self.retry_policy)
             actual_last_row = int(last_cell.row)
             actual_last_col = int(last_cell.column)
             
@@ -176,7 +463,7 @@ class EnhancedExcelProcessor:
 
         # Read headers within our column limit
         headers_raw = EnhancedExcelOptimizer.safe_excel_operation(
-            lambda: sheet.range((header_row, 1), (header_row, last_col)).value
+            lambda: sheet.range((header_row, 1), (header_row, last_col)).value, policy=self.retry_policy
         )
         headers = [str(h).strip() if h else f'Col_{i}' for i, h in enumerate(headers_raw)]
 
@@ -193,7 +480,8 @@ class EnhancedExcelProcessor:
             try:
                 print("   ⚡ Reading limited data range at once...")
                 all_data = EnhancedExcelOptimizer.safe_excel_operation(
-                    lambda: sheet.range((header_row + 1, 1), (last_row, last_col)).value
+                    lambda: sheet.range((header_row + 1, 1), (last_row, last_col)).value,
+                    policy=self.retry_policy
                 )
                 if all_data:
                     if not isinstance(all_data, list):
@@ -210,7 +498,8 @@ class EnhancedExcelProcessor:
                 while r <= last_row:
                     r2 = min(r + step - 1, last_row)
                     chunk = EnhancedExcelOptimizer.safe_excel_operation(
-                        lambda rr=r, rr2=r2: sheet.range((rr, 1), (rr2, last_col)).value
+                        lambda rr=r, rr2=r2: sheet.range((rr, 1), (rr2, last_col)).value,
+                        policy=self.retry_policy
                     )
                     if chunk:
                         if not isinstance(chunk, list):
@@ -224,10 +513,14 @@ class EnhancedExcelProcessor:
         return headers, data
 
     # ---------- business logic ----------
-    def _process_dataframe_enhanced(
-        self, df: pd.DataFrame, sheet: xw.Sheet, header_row: int,
-        headers: List[str], summary_subset: pd.DataFrame
-    ) -> Tuple[int, int]:
+    def _plan_dataframe_updates(
+        self, df: pd.DataFrame, header_row: int,
+        headers: List[str], summary_subset: pd.DataFrame,
+        prepared: Optional[PreparedPartition] = None, sources: Optional[Dict[str, Dict[int, int]]] = None
+    ) -> Tuple[List[Tuple[int, List]], List[Tuple[int, List]]]:
+        """(update pairs, fill pairs); ``sources['update'|'fill']`` collect excel_row -> summary position when given."""
+        if prepared is None:
+            prepared = self._prepare_partition(summary_subset)
 
         df['Item2'] = df['Item2'].astype(str).str.strip()
         df['Note']  = df['Note'].astype(str).str.strip()
@@ -235,7 +528,7 @@ class EnhancedExcelProcessor:
         df_block = df[mask].copy().reset_index(drop=True)
         print(f"   ✔️ {len(df_block)} existing 'Leasing period' + 'Committed' rows found.")
         if df_block.empty:
-            return 0, 0
+            return [], []
 
         df_block['key1*'] = (df_block['Factory code'].astype(str).str.strip() + '|' +
                              df_block['Tenant code'].astype(str).str.strip())
@@ -243,84 +536,44 @@ class EnhancedExcelProcessor:
                              df_block['Tenant name'].astype(str).str.strip())
 
         original_indices = df[mask].index.tolist()
-        updated_summary_indices = set()
+        used_positions = set()
         write_pairs = []
-
-        # update các dòng khớp
-        summary_key1 = summary_subset['Unit name'].astype(str).str.strip() + '|' + summary_subset['Tenant ID'].astype(str).str.strip()
-        summary_key2 = summary_subset['Unit name'].astype(str).str.strip() + '|' + summary_subset['Tenant'].astype(str).str.strip()
-
-        for i, (_, row) in enumerate(df_block.iterrows()):
-            k1, k2 = row['key1*'], row['key2*']
-            match = summary_subset[(summary_key1 == str(k1)) | (summary_key2 == str(k2))]
-            if not match.empty:
-                srow = match.iloc[0]
-                updated_summary_indices.add(match.index[0])
-                new_vals = []
-                for col_name in headers:
-                    val = row.get(col_name, '')
-                    if col_name in self.config.column_mapping.values():
-                        src_col = next((src for src, tgt in self.config.column_mapping.items() if tgt == col_name), None)
-                        if src_col in srow.index:
-                            cand = srow[src_col]
-                            if pd.notna(cand) and str(cand).strip() not in ['', '- None -']:
-                                val = cand
-                    val = self._ensure_scalar(val)
-                    new_vals.append(val)
-                excel_row = header_row + 1 + original_indices[i]
-                write_pairs.append((excel_row, new_vals))
-
-        rows_updated = 0
-        if write_pairs:
-            # Optimized: Batch write all updates at once
-            try:
-                write_pairs.sort(key=lambda x: x[0])
-                print(f"   ⚡ Batch updating {len(write_pairs)} rows...")
-                
-                # Group consecutive rows for range-based updates
-                batch_groups = []
-                current_group = []
-                for excel_row, vals in write_pairs:
-                    if not current_group or excel_row == current_group[-1][0] + 1:
-                        current_group.append((excel_row, vals))
-                    else:
-                        batch_groups.append(current_group)
-                        current_group = [(excel_row, vals)]
-                if current_group:
-                    batch_groups.append(current_group)
-                
-                for group in batch_groups:
-                    if len(group) == 1:
-                        # Single row update
-                        excel_row, vals = group[0]
-                        sheet.range((excel_row, 1), (excel_row, len(headers))).value = vals
-                        rows_updated += 1
-                    else:
-                        # Multi-row batch update
-                        start_row = group[0][0]
-                        end_row = group[-1][0]
-                        batch_data = [vals for _, vals in group]
-                        sheet.range((start_row, 1), (end_row, len(headers))).value = batch_data
-                        rows_updated += len(group)
-                        
-                print(f"   → Updated {rows_updated} existing rows with summary data")
-            except Exception as e:
-                print(f"   ⚠️ Batch update failed, falling back to row-by-row: {e}")
-                # Fallback to original method
-                for excel_row, vals in write_pairs:
-                    try:
-                        sheet.range((excel_row, 1), (excel_row, len(headers))).value = vals
-                        rows_updated += 1
-                    except Exception as e:
-                        print(f"     ⚠️ Update row {excel_row}: {e}")
-                print(f"   → Updated {rows_updated} existing rows with summary data")
-        else:
+        targets = set(self.config.column_mapping.values())
+
+        # positional: a duplicated header reads its first column, as row.get() on a Series did
+        first_col: Dict[str, int] = {}
+        for j, col_name in enumerate(df_block.columns):
+            first_col.setdefault(col_name, j)
+        k1_at, k2_at = first_col['key1*'], first_col['key2*']
+
+        # update các dòng khớp: first summary row whose key1 or key2 matches
+        for i, values in enumerate(df_block.itertuples(index=False, name=None)):
+            p1 = prepared.index1.get(str(values[k1_at]))
+            p2 = prepared.index2.get(str(values[k2_at]))
+            if p1 is None and p2 is None:
+                continue
+            pos = min(p for p in (p1, p2) if p is not None)
+            used_positions.add(pos)
+            proj = prepared.projected[pos]
+            new_vals = []
+            for col_name in headers:
+                j = first_col.get(col_name)
+                val = values[j] if j is not None else ''
+                if col_name in targets and col_name in proj:
+                    val = proj[col_name]
+                new_vals.append(self._ensure_scalar(val))
+            excel_row = header_row + 1 + original_indices[i]
+            write_pairs.append((excel_row, new_vals))
+            if sources is not None:
+                sources['update'][excel_row] = pos
+
+        if not write_pairs:
             print("   → No existing rows matched for update.")
 
         # fill các dòng “green” trống còn lại bằng summary chưa dùng
-        unmatched_summary = summary_subset.loc[~summary_subset.index.isin(updated_summary_indices)]
-        rows_added = 0
-        if not unmatched_summary.empty:
+        unmatched_positions = [p for p in range(len(prepared.projected)) if p not in used_positions]
+        fill_pairs = []
+        if unmatched_positions:
             empty_green_mask = (
                 (df['Item2'].astype(str).str.strip() == 'Leasing period') &
                 (df['Note'].astype(str).str.strip() == 'Committed') &
@@ -329,89 +582,91 @@ class EnhancedExcelProcessor:
                  (df['Tenant name'].astype(str).str.strip() == ''))
             )
             empty_green_rows = df[empty_green_mask]
-            print(f"   → Empty green rows: {len(empty_green_rows)} | Unmatched summary: {len(unmatched_summary)}")
+            print(f"   → Empty green rows: {len(empty_green_rows)} | Unmatched summary: {len(unmatched_positions)}")
 
             if len(empty_green_rows) > 0:
                 empty_excel_rows = [header_row + 1 + idx for idx in empty_green_rows.index.tolist()]
-                fill_pairs = []
-                for i, (_, srow) in enumerate(unmatched_summary.iterrows()):
+                for i, pos in enumerate(unmatched_positions):
                     if i >= len(empty_excel_rows): break
                     excel_row = empty_excel_rows[i]
+                    proj = prepared.projected[pos]
                     new_vals = []
                     for col_name in headers:
                         val = ''
-                        if col_name in self.config.column_mapping.values():
-                            src_col = next((src for src, tgt in self.config.column_mapping.items() if tgt == col_name), None)
-                            if src_col in srow.index:
-                                cand = srow[src_col]
-                                if pd.notna(cand) and str(cand).strip() not in ['', '- None -']:
-                                    val = cand
+                        if col_name in targets:
+                            val = proj.get(col_name, '')
                         elif col_name == 'Item2':
                             val = 'Leasing period'
                         elif col_name == 'Note':
                             val = 'Committed'
                         elif col_name == 'Factory code':
-                            val = srow.get('Unit name', '')
+                            val = prepared.subset.iloc[pos].get('Unit name', '')
                         elif col_name == 'Tenant code':
-                            val = srow.get('Tenant ID', '')
+                            val = prepared.subset.iloc[pos].get('Tenant ID', '')
                         elif col_name == 'Tenant name':
-                            val = srow.get('Tenant', '')
+                            val = prepared.subset.iloc[pos].get('Tenant', '')
                         else:
                             row_idx = empty_green_rows.index[i]
                             current_val = df.iloc[row_idx].get(col_name, '')
                             val = self._ensure_scalar(current_val) if current_val != '' else ''
                         new_vals.append(self._ensure_scalar(val))
                     fill_pairs.append((excel_row, new_vals))
-
-                # Optimized: Batch write all fills at once
-                try:
-                    print(f"   ⚡ Batch filling {len(fill_pairs)} rows...")
-                    
-                    # Group consecutive rows for range-based fills
-                    fill_groups = []
-                    current_group = []
-                    fill_pairs.sort(key=lambda x: x[0])
-                    
-                    for excel_row, vals in fill_pairs:
-                        if not current_group or excel_row == current_group[-1][0] + 1:
-                            current_group.append((excel_row, vals))
-                        else:
-                            fill_groups.append(current_group)
-                            current_group = [(excel_row, vals)]
-                    if current_group:
-                        fill_groups.append(current_group)
-                    
-                    for group in fill_groups:
-                        if len(group) == 1:
-                            # Single row fill
-                            excel_row, vals = group[0]
-                            sheet.range((excel_row, 1), (excel_row, len(headers))).value = vals
-                            rows_added += 1
-                        else:
-                            # Multi-row batch fill
-                            start_row = group[0][0]
-                            end_row = group[-1][0]
-                            batch_data = [vals for _, vals in group]
-                            sheet.range((start_row, 1), (end_row, len(headers))).value = batch_data
-                            rows_added += len(group)
-                            
-                except Exception as e:
-                    print(f"   ⚠️ Batch fill failed, falling back to row-by-row: {e}")
-                    # Fallback to original method
-                    for excel_row, vals in fill_pairs:
-                        try:
-                            sheet.range((excel_row, 1), (excel_row, len(headers))).value = vals
-                            rows_added += 1
-                        except Exception as e:
-                            print(f"     ⚠️ Fill row {excel_row}: {e}")
-                            
-                print(f"   → Filled {rows_added} empty green rows")
+                    if sources is not None:
+                        sources['fill'][excel_row] = pos
             else:
                 print("   ⚠️ No empty green rows to fill")
         else:
             print("   → No unmatched summary rows to fill")
 
-        return rows_updated, rows_added
+        return write_pairs, fill_pairs
+
+    @staticmethod
+    def _write_row_pairs(sheet: xw.Sheet, pairs: List[Tuple[int, List]], width: int, label: str) -> int:
+        """Write (excel_row, values) pairs, grouping consecutive rows into one range call."""
+        if not pairs:
+            return 0
+        written = 0
+        # Optimized: Batch write all rows at once
+        try:
+            pairs = sorted(pairs, key=lambda x: x[0])
+            print(f"   ⚡ Batch {label} of {len(pairs)} rows...")
+
+            # Group consecutive rows for range-based writes
+            groups = []
+            current_group = []
+            for excel_row, vals in pairs:
+                if not current_group or excel_row == current_group[-1][0] + 1:
+                    current_group.append((excel_row, vals))
+                else:
+                    groups.append(current_group)
+                    current_group = [(excel_row, vals)]
+            if current_group:
+                groups.append(current_group)
+
+            for group in groups:
+                if len(group) == 1:
+                    # Single row write
+                    excel_row, vals = group[0]
+                    sheet.range((excel_row, 1), (excel_row, width)).value = vals
+                    written += 1
+                else:
+                    # Multi-row batch write
+                    start_row = group[0][0]
+                    end_row = group[-1][0]
+                    batch_data = [vals for _, vals in group]
+                    sheet.range((start_row, 1), (end_row, width)).value = batch_data
+                    written += len(group)
+        except Exception as e:
+            print(f"   ⚠️ Batch {label} failed, falling back to row-by-row: {e}")
+            # Fallback to original method
+            written = 0
+            for excel_row, vals in pairs:
+                try:
+                    sheet.range((excel_row, 1), (excel_row, width)).value = vals
+                    written += 1
+                except Exception as e:
+                    print(f"     ⚠️ {label.capitalize()} row {excel_row}: {e}")
+        return written
 
     @staticmethod
     def _ensure_scalar(val):
@@ -0,0 +1,213 @@
+# excel_processor/retry.py
+import os, time, random, threading
+from typing import Callable, Optional
+
+from .models import ProcessingConfig, ProcessingResult
+
+class FailureKind:
+    TRANSIENT_COM = "transient_com"      # Excel busy / call rejected
+    EXCEL_CRASH = "excel_crash"          # Excel died or never came up
+    MISSING_SHEET = "missing_sheet"
+    MISSING_HEADER = "missing_header"
+    NO_SUBSIDIARY = "no_subsidiary_match"
+    NO_DATA = "no_data"
+    DATA_ERROR = "data_error"            # Python error on the workbook's content (KeyError, ...)
+    CIRCUIT_OPEN = "circuit_open"
+    SESSION_LIMIT = "session_limit"      # supervisor killed the session (time/memory)
+    UNKNOWN = "unknown"
+
+    # Smallest scope that can fix the failure; kinds not listed are not retried.
+    #   call    - repeat the single COM call (safe_excel_operation)
+    #   session - fresh Excel instance for the same file
+    #   file    - clean up stray Excel processes, then redo the whole file
+    RETRY_SCOPE = {
+        TRANSIENT_COM: "call",
+        EXCEL_CRASH: "session",
+        UNKNOWN: "file",
+    }
+    BACKEND = {TRANSIENT_COM, EXCEL_CRASH}
+    # problems with the workbook's content; the Excel session itself is fine
+    DATA = {MISSING_SHEET, MISSING_HEADER, NO_SUBSIDIARY, NO_DATA, DATA_ERROR}
+    # deterministic: the same workbook fails the same way, so these are never retried
+    _DATA_ERRORS = (KeyError, IndexError, TypeError, ValueError, AttributeError, ZeroDivisionError)
+    _DISP_E_EXCEPTION = -2147352567       # Excel's own errors; real code in excepinfo[5]
+
+    _TRANSIENT_HRESULTS = {
+        -2147418111,  # RPC_E_CALL_REJECTED
+        -2147417846,  # RPC_E_SERVERCALL_RETRYLATER
+        -2146777998,  # VBA_E_IGNORE (Excel is in edit mode / busy)
+    }
+    _CRASH_HRESULTS = {
+        -2147023174,  # RPC_S_SERVER_UNAVAILABLE
+        -2147023170,  # RPC_S_CALL_FAILED
+        -2147417848,  # RPC_E_DISCONNECTED
+        -2147417851,  # RPC_E_SERVERFAULT
+    }
+    _MESSAGES = (
+        ("call was rejected", TRANSIENT_COM),
+        ("retrylater", TRANSIENT_COM),
+        ("rpc server is unavailable", EXCEL_CRASH),
+        ("remote procedure call failed", EXCEL_CRASH),
+        ("disconnected from its clients", EXCEL_CRASH),
+        ("server threw an exception", EXCEL_CRASH),
+        ("could not initialize excel", EXCEL_CRASH),
+        ("sheet not found", MISSING_SHEET),
+        ("header row not found", MISSING_HEADER),
+        ("no summary data for subsidiary", NO_SUBSIDIARY),
+        ("no data rows found", NO_DATA),
+    )
+
+    @classmethod
+    def classify(cls, error) -> str:
+        """Map a COM exception (or an error message) onto a FailureKind."""
+        codes = cls._hresults(error)
+        if codes & cls._TRANSIENT_HRESULTS:
+            return cls.TRANSIENT_COM
+        if codes & cls._CRASH_HRESULTS:
+            return cls.EXCEL_CRASH
+        text = str(error).lower()
+        for needle, kind in cls._MESSAGES:
+            if needle in text:
+                return kind
+        if not codes and isinstance(error, cls._DATA_ERRORS):
+            return cls.DATA_ERROR
+        return cls.UNKNOWN
+
+    @classmethod
+    def _hresults(cls, error) -> set:
+        """Top-level HRESULT plus, for DISP_E_EXCEPTION, the scode from excepinfo."""
+        if not isinstance(error, Exception):
+            return set()
+        hresult = getattr(error, "hresult", None)
+        args = error.args
+        if hresult is None and args and isinstance(args[0], int):
+            hresult = args[0]  # pywintypes.com_error: (hresult, text, excepinfo, argerr)
+        codes = {hresult} if isinstance(hresult, int) else set()
+        excepinfo = getattr(error, "excepinfo", None) or (args[2] if len(args) > 2 else None)
+        if isinstance(excepinfo, tuple) and len(excepinfo) > 5 and isinstance(excepinfo[5], int):
+            codes.add(excepinfo[5])  # e.g. (0, 'Microsoft Excel', ..., 0, -2146777998) for "busy"
+        return codes
+
+    @classmethod
+    def is_retryable(cls, kind: str) -> bool:
+        return kind in cls.RETRY_SCOPE
+
+class CircuitBreaker:
+    """Stops scheduling Excel work after ``threshold`` consecutive backend failures.
+
+    After ``cooldown`` seconds exactly one caller gets a trial (half-open);
+    everyone else is refused until that trial's outcome closes the circuit
+    or, on another backend failure, reopens it for a new cooldown.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False  # half-open: the single trial is in flight
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self._trial = True
+            print("   🔌 Circuit half-open: one trial against the Excel backend")
+            return True
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def record(self, kind: str):
+        with self._lock:
+            if kind in FailureKind.BACKEND:
+                self.failures += 1
+                if self._trial:
+                    self._trial = False
+                    self.opened_at = time.monotonic()
+                    print(f"   🔌 Trial failed, circuit reopened (cooling down {self.cooldown:.0f}s)")
+                elif self.failures >= self.threshold and self.opened_at is None:
+                    self.opened_at = time.monotonic()
+                    print(f"   🔌 Circuit open after {self.failures} backend failures "
+                          f"(cooling down {self.cooldown:.0f}s)")
+                return
+            if self.opened_at is not None:
+                if not self._trial:
+                    return  # outcome of work admitted before the circuit opened
+                self._trial = False
+                self.opened_at = None
+                print("   🔌 Trial succeeded, circuit closed")
+            self.failures = 0
+
+class RetryPolicy:
+    def __init__(self, attempts: int = 2, call_attempts: int = 3,
+                 base_delay: float = 0.25, call_base_delay: float = 0.05, max_delay: float = 8.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.attempts = max(1, attempts)
+        self.call_attempts = max(1, call_attempts)
+        self.base_delay = base_delay
+        self.call_base_delay = call_base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+
+    @classmethod
+    def from_config(cls, config: ProcessingConfig) -> "RetryPolicy":
+        return cls(attempts=config.retry_attempts, call_attempts=config.call_retry_attempts,
+                   base_delay=config.retry_base_delay, max_delay=config.retry_max_delay,
+                   breaker=CircuitBreaker(config.breaker_threshold, config.breaker_cooldown))
+
+    def backoff(self, attempt: int, base: Optional[float] = None) -> float:
+        """Exponential backoff with equal jitter: half fixed, half random."""
+        cap = min(self.max_delay, (self.base_delay if base is None else base) * (2 ** attempt))
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Call-scope retry: only transient COM errors are repeated, everything else raises."""
+        for attempt in range(self.call_attempts):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt + 1 >= self.call_attempts or FailureKind.classify(e) != FailureKind.TRANSIENT_COM:
+                    raise
+                time.sleep(self.backoff(attempt, self.call_base_delay))
+
+    def run_file(self, filepath: str, process: Callable[[], ProcessingResult],
+                 reset_backend: Optional[Callable[[], None]] = None, first_attempt: int = 0) -> ProcessingResult:
+        """Run ``process`` for one file, retrying at the smallest scope its failure allows.
+
+        ``first_attempt`` > 0 continues a file whose earlier attempts ran elsewhere (the pipeline).
+        """
+        res = None
+        for attempt in range(first_attempt, self.attempts):
+            if self.breaker and not self.breaker.allow():
+                return ProcessingResult(filepath=filepath, status='error', attempts=attempt,
+                                        error_message="Circuit open: Excel backend keeps failing",
+                                        failure_kind=FailureKind.CIRCUIT_OPEN)
+            res = process()
+            res.attempts = attempt + 1
+            if res.status == 'success':
+                if self.breaker: self.breaker.record("")
+                return res
+            kind = res.failure_kind or FailureKind.classify(res.error_message)
+            res.failure_kind = kind
+            if self.breaker: self.breaker.record(kind)
+            if not FailureKind.is_retryable(kind) or attempt + 1 >= self.attempts:
+                return res
+            if self.breaker and self.breaker.is_open:
+                return res
+            scope = FailureKind.RETRY_SCOPE[kind]
+            if scope == "call":
+                scope = "session"  # call-level retries inside the file already gave up
+            delay = self.backoff(attempt)
+            print(f"   🔄 Retrying {os.path.basename(filepath)} in {delay:.2f}s "
+                  f"({kind}, {scope} scope, attempt {attempt+2}/{self.attempts})")
+            if scope == "file" and reset_backend:
+                reset_backend()
+            time.sleep(delay)
+        return res
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
@@ -0,0 +1,120 @@
+# excel_processor/scheduler.py
+from __future__ import annotations
+import os, json, heapq
+from typing import Dict, List, Tuple
+
+from .models import ProcessingResult
+
+class FileCostModel:
+    """Per-file cost estimates for ordering a batch, learned from past runs.
+
+    A file with history is estimated from its smoothed past time, scaled by how
+    much it grew since. Unknown files use ``overhead + per_mb * size`` fitted
+    over all files with history. State is ``file_costs.json`` in ``state_dir``.
+    """
+    STATE_FILE = "file_costs.json"
+    DEFAULT_OVERHEAD = 15.0  # seconds: Excel start + open + save of a small model
+    DEFAULT_PER_MB = 1.0
+
+    def __init__(self, state_dir: str, smoothing: float = 0.5):
+        self.state_dir = state_dir
+        self.smoothing = smoothing
+        self.files: Dict[str, dict] = {}  # abspath -> {"seconds", "mb", "runs"}
+        self.overhead = self.DEFAULT_OVERHEAD
+        self.per_mb = self.DEFAULT_PER_MB
+        try:
+            with open(os.path.join(state_dir, self.STATE_FILE), encoding="utf-8") as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+            self.overhead = data.get("overhead", self.overhead)
+            self.per_mb = data.get("per_mb", self.per_mb)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"   ⚠️ Ignoring unreadable cost model: {e}")
+
+    @staticmethod
+    def _size_mb(fp: str) -> float:
+        try:
+            return os.path.getsize(fp) / 1024 / 1024
+        except OSError:
+            return 0.0
+
+    def estimate(self, fp: str) -> Tuple[float, str]:
+        """(seconds, source) where source is 'history' or 'size'."""
+        mb = self._size_mb(fp)
+        entry = self.files.get(os.path.abspath(fp))
+        if entry and entry.get("seconds"):
+            past_mb = entry.get("mb") or mb
+            growth = (self.overhead + self.per_mb * mb) / max(self.overhead + self.per_mb * past_mb, 1e-6)
+            return entry["seconds"] * growth, "history"
+        return self.overhead + self.per_mb * mb, "size"
+
+    def order(self, file_paths: List[str]) -> List[str]:
+        """Longest estimated time first (LPT); ties keep the original order."""
+        costs = {fp: self.estimate(fp)[0] for fp in file_paths}
+        return sorted(file_paths, key=lambda fp: -costs[fp])
+
+    @staticmethod
+    def makespan(costs: List[float], workers: int, batched: bool = False) -> float:
+        """Predicted wall time: greedy list scheduling, or fixed batches that wait for their slowest file."""
+        workers = max(1, workers)
+        if batched:
+            return sum(max(costs[i:i + workers]) for i in range(0, len(costs), workers))
+        finish = [0.0] * min(workers, len(costs) or 1)
+        for c in costs:
+            heapq.heappush(finish, heapq.heappop(finish) + c)
+        return max(finish)
+
+    def print_plan(self, original: List[str], ordered: List[str], workers: int, batched: bool):
+        est = {fp: self.estimate(fp) for fp in original}
+        before = self.makespan([est[fp][0] for fp in original], workers, batched)
+        after = self.makespan([est[fp][0] for fp in ordered], workers, batched)
+        known = sum(1 for fp in original if est[fp][1] == "history")
+        print(f"\n🗓️ SCHEDULE (longest first, {workers} worker(s){', batched' if batched else ''})")
+        print(f"   📐 Cost model: {self.overhead:.1f}s + {self.per_mb:.2f}s/MB | "
+              f"{known}/{len(original)} file(s) with history")
+        for fp in ordered[:5]:
+            print(f"   ⏳ {os.path.basename(fp)}: ~{est[fp][0]:.0f}s ({est[fp][1]}, {self._size_mb(fp):.1f}MB)")
+        if len(ordered) > 5:
+            print(f"   … {len(ordered) - 5} more")
+        gain = (1 - after / before) if before else 0.0
+        print(f"   🎯 Predicted batch time: {after:.0f}s vs {before:.0f}s in folder order ({gain:.0%} shorter)")
+
+    def record_run(self, results: List[ProcessingResult]):
+        """Fold successful per-file times into the model and refit the size rate."""
+        for r in results:
+            if r.status != 'success' or r.processing_time <= 0:
+                continue
+            key = os.path.abspath(r.filepath)
+            entry = self.files.get(key)
+            if entry:
+                entry["seconds"] += self.smoothing * (r.processing_time - entry["seconds"])
+                entry["runs"] = entry.get("runs", 1) + 1
+            else:
+                entry = self.files[key] = {"seconds": r.processing_time, "runs": 1}
+            entry["mb"] = self._size_mb(r.filepath)
+        self._fit()
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = os.path.join(self.state_dir, self.STATE_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"overhead": self.overhead, "per_mb": self.per_mb, "files": self.files}, f)
+        os.replace(path + ".tmp", path)
+
+    def _fit(self):
+        """Least-squares fit of seconds = overhead + per_mb * MB over files with history."""
+        pts = [(e["mb"], e["seconds"]) for e in self.files.values() if e.get("mb") is not None]
+        if len(pts) < 2:
+            if pts and pts[0][0] > 0:
+                self.per_mb = max(0.0, (pts[0][1] - self.overhead) / pts[0][0])
+            return
+        n = len(pts)
+        mx = sum(x for x, _ in pts) / n
+        my = sum(y for _, y in pts) / n
+        sxx = sum((x - mx) ** 2 for x, _ in pts)
+        if sxx <= 1e-9:  # all the same size: only the level is known
+            self.overhead = max(0.0, my - self.per_mb * mx)
+            return
+        slope = sum((x - mx) * (y - my) for x, y in pts) / sxx
+        self.per_mb = max(0.0, slope)
+        self.overhead = max(0.0, my - self.per_mb * mx)
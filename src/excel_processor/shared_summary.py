@@ -0,0 +1,126 @@
+# excel_processor/shared_summary.py
+from __future__ import annotations
+import os, json, mmap, struct, tempfile
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+MAGIC = b"XSUMCOL1"
+_ALIGN = 8
+
+class SharedSummary:
+    """Publishes the loaded summary once as a memory-mapped columnar file.
+
+    Layout: MAGIC, header length, JSON header, then 8-byte aligned sections.
+    Rows are grouped by Subsidiary (stable, so sheet order is kept inside a
+    group); the header maps each subsidiary to its row range. Each column is
+    an int64 offset array plus one UTF-8 blob, and an int64 section keeps the
+    original row labels. Process workers map the file read-only and decode
+    only the partitions they touch, so their memory does not grow with the
+    summary.
+    """
+
+    @staticmethod
+    def publish(summary: pd.DataFrame, columns: List[str], directory: Optional[str] = None) -> str:
+        import numpy as np
+        cols = [c for c in columns if c in summary.columns]
+        subs = summary['Subsidiary'].astype(str).to_numpy()
+        order = np.argsort(subs, kind='stable')
+        n = len(order)
+
+        sections: List[Tuple[str, bytes]] = [("index", summary.index.to_numpy(dtype=np.int64)[order].tobytes())]
+        for c in cols:
+            encoded = [v.encode("utf-8") for v in summary[c].astype(str).to_numpy()[order]]
+            offsets = np.zeros(n + 1, dtype=np.int64)
+            if n:
+                offsets[1:] = np.cumsum([len(b) for b in encoded])
+            sections.append((f"{c}:offsets", offsets.tobytes()))
+            sections.append((f"{c}:blob", b"".join(encoded)))
+
+        ranges: Dict[str, List[int]] = {}
+        sorted_subs = subs[order]
+        start = 0
+        for i in range(1, n + 1):
+            if i == n or sorted_subs[i] != sorted_subs[start]:
+                ranges[str(sorted_subs[start])] = [start, i]
+                start = i
+
+        # header size depends on section offsets, which depend on header size: fix it with padding
+        layout: Dict[str, List[int]] = {}
+        header = {"rows": n, "columns": cols, "subsidiaries": ranges, "sections": layout}
+        reserve = len(json.dumps(header, ensure_ascii=False).encode("utf-8")) + sum(
+            len(json.dumps(name, ensure_ascii=False).encode("utf-8")) + 48 for name, _ in sections)
+        pos = SharedSummary._aligned(16 + reserve)
+        for name, data in sections:
+            layout[name] = [pos, len(data)]
+            pos = SharedSummary._aligned(pos + len(data))
+        raw_header = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        assert len(raw_header) <= reserve
+
+        fd, path = tempfile.mkstemp(prefix="summary_", suffix=".xsum", dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + struct.pack("<q", len(raw_header)) + raw_header)
+            for name, data in sections:
+                f.seek(layout[name][0])
+                f.write(data)
+            f.truncate(max(pos, 16 + reserve))
+        return path
+
+    @staticmethod
+    def _aligned(pos: int) -> int:
+        return (pos + _ALIGN - 1) // _ALIGN * _ALIGN
+
+class SharedSummaryView:
+    """Read-only, zero-copy view on a published summary file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:8] != MAGIC:
+            raise ValueError(f"{path} is not a published summary file")
+        (hlen,) = struct.unpack("<q", self._mm[8:16])
+        header = json.loads(self._mm[16:16 + hlen].decode("utf-8"))
+        self.rows = header["rows"]
+        self.columns: List[str] = header["columns"]
+        self.subsidiaries: Dict[str, List[int]] = header["subsidiaries"]
+        self._sections: Dict[str, List[int]] = header["sections"]
+
+    def _int64(self, section: str, start: int, count: int):
+        import numpy as np
+        off, _ = self._sections[section]
+        return np.frombuffer(self._mm, dtype=np.int64, count=count, offset=off + 8 * start)
+
+    def _strings(self, column: str, start: int, end: int) -> List[str]:
+        offsets = self._int64(f"{column}:offsets", start, end - start + 1)
+        base = self._sections[f"{column}:blob"][0]
+        blob = self._mm[base + int(offsets[0]):base + int(offsets[-1])]
+        rel = offsets - offsets[0]
+        return [blob[int(a):int(b)].decode("utf-8") for a, b in zip(rel[:-1], rel[1:])]
+
+    def rows_for(self, names: Optional[List[str]] = None) -> pd.DataFrame:
+        """Decode the rows of the given subsidiaries (all rows when ``names`` is None)."""
+        import numpy as np
+        import pandas as pd
+        spans = [(0, self.rows)] if names is None else sorted(
+            tuple(self.subsidiaries[n]) for n in names if n in self.subsidiaries)
+        data: Dict[str, List[str]] = {c: [] for c in self.columns}
+        labels = []
+        for start, end in spans:
+            if end <= start:
+                continue
+            labels.append(self._int64("index", start, end - start))
+            for c in self.columns:
+                data[c].extend(self._strings(c, start, end))
+        index = np.concatenate(labels) if labels else np.zeros(0, dtype=np.int64)
+        frame = pd.DataFrame(data, index=index, columns=self.columns, dtype=object)
+        return frame.sort_index(kind="stable")  # back to summary order across subsidiaries
+
+    def close(self):
+        try:
+            self._mm.close()
+        except BufferError:
+            pass  # a decoded partition still references the map; it is released with it
+        finally:
+            self._file.close()
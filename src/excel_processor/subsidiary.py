@@ -1,6 +1,10 @@
 # excel_processor/subsidiary.py
-import os
-import xlwings as xw
+from __future__ import annotations
+import os, re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import xlwings as xw
 
 class SubsidiaryExtractor:
     @staticmethod
@@ -29,6 +33,39 @@ class SubsidiaryExtractor:
         print(f"   ⚠️ Could not extract subsidiary from {filename}")
         return ""
 
+    @staticmethod
+    def match_summary_names(extracted: str, names, verbose: bool = False) -> list:
+        """Summary 'Subsidiary' values a file with this code maps to.
+
+        The one resolver for both the processor (which rows a file is synced
+        against) and the delta tracker (which files a summary change affects):
+        exact name, else the last name whose part before '-' is the code, else
+        a case-insensitive pattern search. Blank names never match; an empty
+        code maps to every name.
+        """
+        names = [str(n) for n in names if n is not None and n == n and str(n).strip()]  # n == n drops NaN
+        if not extracted:
+            return names
+        code = extracted.strip().upper()
+        exact = [n for n in names if n.strip().upper() == code]
+        if exact:
+            return exact
+        prefixed = [n for n in names if '-' in n and n.strip().upper().split('-')[0].strip() == code]
+        if prefixed:
+            original = prefixed[-1].strip()
+            if verbose:
+                print(f"   🔄 Matched {extracted} -> {original}")
+            return [n for n in names if n.strip() == original]
+        try:
+            pattern = re.compile(extracted, re.IGNORECASE)
+            partial = [n for n in names if pattern.search(n)]
+        except re.error:
+            partial = [n for n in names if code in n.upper()]
+        if verbose:
+            print(f"   🔍 Partial match for {extracted}" if partial
+                  else f"   ⚠️ No subsidiary match for '{extracted}'")
+        return partial
+
     @staticmethod
     def _extract_from_filename(filename: str) -> str:
         name = filename.replace('.xlsb', '').replace('.xlsx', '')
@@ -0,0 +1,195 @@
+# excel_processor/supervisor.py
+import os, time, threading, subprocess
+from typing import Dict, List, Optional
+
+from .models import ProcessingConfig, SupervisedProcess
+
+class ProcessSupervisor:
+    """Tracks the backend processes this run spawned and kills only those.
+
+    Every Excel instance is registered by PID right after it starts. A monitor
+    thread enforces the per-session wall-clock and memory limits and kills just
+    the offending instance; orphan sweeps never look beyond the registry, so a
+    user's own Excel or a sibling worker's session is left alone.
+    """
+
+    def __init__(self, wall_limit: float = 0.0, memory_limit_mb: float = 0.0, poll_interval: float = 1.0):
+        self.wall_limit = wall_limit
+        self.memory_limit_mb = memory_limit_mb
+        self.poll_interval = poll_interval
+        self._procs: Dict[int, SupervisedProcess] = {}
+        self._kill_reasons: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls, config: ProcessingConfig) -> "ProcessSupervisor":
+        return cls(wall_limit=config.timeout_seconds, memory_limit_mb=config.session_memory_limit_mb,
+                   poll_interval=config.supervisor_poll_interval)
+
+    # ---------- registry ----------
+    def spawn(self, argv: List[str], label: str = "") -> subprocess.Popen:
+        """Start and register a child process (non-Excel backends, dummy children in tests)."""
+        popen = subprocess.Popen(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.register(popen.pid, label or os.path.basename(argv[0]), popen=popen)
+        return popen
+
+    def register(self, pid: Optional[int], label: str = "", popen=None) -> bool:
+        import psutil
+        if not pid:
+            return False
+        try:
+            create_time = psutil.Process(pid).create_time()
+        except psutil.Error:
+            return False
+        with self._lock:
+            self._kill_reasons.pop(pid, None)  # PID reused by a new process: the old kill isn't its
+            self._procs[pid] = SupervisedProcess(pid=pid, label=label, started=time.monotonic(),
+                                                 create_time=create_time, owner=threading.get_ident(),
+                                                 popen=popen)
+        self._ensure_monitor()
+        return True
+
+    def release(self, pid: Optional[int], grace: float = 5.0):
+        """Session ended normally: give the process ``grace`` seconds to exit, then kill it."""
+        with self._lock:
+            entry = self._procs.pop(pid, None) if pid else None
+        if not entry:
+            return
+        proc = self._live_process(entry)
+        if proc is None:
+            self._reap(entry)
+            return
+        try:
+            proc.wait(timeout=grace)
+            self._reap(entry)
+        except Exception:
+            self._kill(entry, f"did not exit within {grace:g}s of quit")
+
+    def park(self, pid: Optional[int]):
+        """Session goes idle in a warm pool: stop counting wall-clock time (memory is still checked)."""
+        with self._lock:
+            entry = self._procs.get(pid) if pid else None
+            if entry:
+                entry.parked = True
+
+    def rearm(self, pid: Optional[int]) -> bool:
+        """Warm session picks up a new file: restart its wall-clock budget. False if it was killed."""
+        with self._lock:
+            entry = self._procs.get(pid) if pid else None
+            if entry:
+                entry.parked = False
+                entry.started = time.monotonic()
+        return entry is not None
+
+    def kill_reason(self, pid: Optional[int]) -> str:
+        with self._lock:
+            return self._kill_reasons.get(pid, "") if pid else ""
+
+    def active_pids(self) -> List[int]:
+        with self._lock:
+            return list(self._procs)
+
+    # ---------- enforcement ----------
+    def check_limits(self):
+        with self._lock:
+            entries = list(self._procs.values())
+        now = time.monotonic()
+        for entry in entries:
+            proc = self._live_process(entry)
+            if proc is None:
+                continue
+            reason = ""
+            elapsed = now - entry.started
+            if self.wall_limit and not entry.parked and elapsed > self.wall_limit:
+                reason = f"exceeded wall-clock limit ({elapsed:.1f}s > {self.wall_limit:g}s)"
+            elif self.memory_limit_mb:
+                try:
+                    rss_mb = proc.memory_info().rss / 1024 / 1024
+                except Exception:
+                    continue
+                if rss_mb > self.memory_limit_mb:
+                    reason = f"exceeded memory limit ({rss_mb:.0f}MB > {self.memory_limit_mb:.0f}MB)"
+            if reason:
+                with self._lock:
+                    self._procs.pop(entry.pid, None)
+                self._kill(entry, reason)
+
+    def sweep_orphans(self, owner: Optional[int] = None) -> int:
+        """Kill registered processes still alive (optionally only those a given thread started)."""
+        with self._lock:
+            victims = [e for e in self._procs.values() if owner is None or e.owner == owner]
+            for e in victims:
+                self._procs.pop(e.pid, None)
+        killed = 0
+        for entry in victims:
+            if self._live_process(entry) is not None:
+                self._kill(entry, "orphaned session")
+                killed += 1
+            else:
+                self._reap(entry)
+        return killed
+
+    def shutdown(self):
+        self._stop.set()
+        if self._monitor and self._monitor is not threading.current_thread():
+            self._monitor.join(timeout=self.poll_interval + 1)
+        self._monitor = None
+        self.sweep_orphans()
+
+    # ---------- internals ----------
+    def _ensure_monitor(self):
+        if not (self.wall_limit or self.memory_limit_mb):
+            return
+        with self._lock:
+            if self._monitor and self._monitor.is_alive():
+                return
+            self._stop.clear()
+            self._monitor = threading.Thread(target=self._monitor_loop, name="process-supervisor", daemon=True)
+            self._monitor.start()
+
+    def _monitor_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_limits()
+            except Exception as e:
+                print(f"   ⚠️ Supervisor check failed: {e}")
+
+    @staticmethod
+    def _live_process(entry: SupervisedProcess):
+        import psutil
+        try:
+            proc = psutil.Process(entry.pid)
+            if proc.create_time() != entry.create_time or proc.status() == psutil.STATUS_ZOMBIE:
+                return None
+            return proc
+        except psutil.Error:
+            return None
+
+    @staticmethod
+    def _reap(entry: SupervisedProcess):
+        if entry.popen is not None:
+            try:
+                entry.popen.wait(timeout=0)
+            except Exception:
+                pass
+
+    def _kill(self, entry: SupervisedProcess, reason: str):
+        import psutil
+        with self._lock:
+            self._kill_reasons[entry.pid] = reason
+        proc = self._live_process(entry)
+        if proc is not None:
+            print(f"   🔪 Killing {entry.label or 'backend'} (pid {entry.pid}): {reason}")
+            try:
+                targets = proc.children(recursive=True) + [proc]
+            except psutil.Error:
+                targets = [proc]
+            for p in targets:
+                try:
+                    p.kill()
+                except psutil.Error:
+                    pass
+            psutil.wait_procs(targets, timeout=5)
+        self._reap(entry)
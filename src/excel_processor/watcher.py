@@ -0,0 +1,248 @@
+# excel_processor/watcher.py
+from __future__ import annotations
+import os, time, queue, threading
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from .models import ProcessingResult
+from .com_management import COMManager, ExcelSessionPool
+from .delta import SummaryDeltaTracker
+
+if TYPE_CHECKING:
+    from .batch import RobustBatchProcessor
+
+Signature = Tuple[int, int]  # (mtime_ns, size)
+
+def file_signature(path: str) -> Optional[Signature]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+class FolderWatcher:
+    """Change notifications for the entity folder and the summary file.
+
+    Uses watchdog (inotify on Linux, ReadDirectoryChangesW on Windows) when it
+    is installed, otherwise scans the folder every ``poll_interval`` seconds.
+    Either way the result is a queue of absolute paths that may have changed.
+    """
+
+    def __init__(self, entity_folder: str, summary_path: str, poll_interval: float = 1.0):
+        self.entity_folder = os.path.abspath(entity_folder)
+        self.summary_path = os.path.abspath(summary_path)
+        self.poll_interval = poll_interval
+        self.events: "queue.Queue[str]" = queue.Queue()
+        self.backend = ""
+        self._observer = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def relevant(self, path: str) -> bool:
+        path = os.path.abspath(path)
+        if path == self.summary_path:
+            return True
+        name = os.path.basename(path)
+        return (os.path.dirname(path) == self.entity_folder and name.lower().endswith('.xlsb')
+                and not name.startswith('~'))
+
+    def entity_files(self) -> List[str]:
+        try:
+            names = os.listdir(self.entity_folder)
+        except OSError:
+            return []
+        return sorted(p for p in (os.path.join(self.entity_folder, n) for n in names) if self.relevant(p))
+
+    def start(self) -> str:
+        try:
+            self._start_native()
+            self.backend = "native"
+        except ImportError:
+            self._thread = threading.Thread(target=self._poll_loop, name="folder-poll", daemon=True)
+            self._thread.start()
+            self.backend = f"polling every {self.poll_interval:g}s"
+        return self.backend
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=2)
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+
+    def _start_native(self):
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                # Excel saves to a temp name and renames it over the original
+                for path in (event.src_path, getattr(event, 'dest_path', '')):
+                    if path and watcher.relevant(path):
+                        watcher.events.put(os.path.abspath(path))
+
+        observer = Observer()
+        observer.schedule(_Handler(), self.entity_folder, recursive=False)
+        summary_dir = os.path.dirname(self.summary_path)
+        if summary_dir != self.entity_folder:
+            observer.schedule(_Handler(), summary_dir, recursive=False)
+        observer.start()
+        self._observer = observer
+
+    def _poll_loop(self):
+        seen = {p: file_signature(p) for p in self.entity_files() + [self.summary_path]}
+        while not self._stop.wait(self.poll_interval):
+            current = {p: file_signature(p) for p in self.entity_files() + [self.summary_path]}
+            for path, sig in current.items():
+                if sig is not None and seen.get(path) != sig:
+                    self.events.put(path)
+            seen = current
+
+class WatchDaemon:
+    """Long-running sync: warm summary + warm Excel, only changed files re-synced.
+
+    Bursts of saves are debounced per path. Entity files sync on their own
+    change; a summary change reloads the summary, rebuilds the cached prepared
+    partitions against it, and re-syncs the files the delta tracker maps to
+    the changed subsidiaries. Our own saves are recognised by signature and ignored.
+    """
+
+    def __init__(self, batch: RobustBatchProcessor, entity_folder: str, summary_path: str, state_dir: str):
+        self.batch = batch
+        self.config = batch.config
+        self.summary_path = summary_path
+        self.tracker = SummaryDeltaTracker(state_dir)
+        self.watcher = FolderWatcher(entity_folder, summary_path, self.config.watch_poll_interval)
+        self.pool = ExcelSessionPool(batch.supervisor, size=self.config.warm_sessions,
+                                     max_uses=self.config.session_max_uses, policy=batch.retry_policy)
+        self.processor = None
+        self.snapshot = None
+        self._pending: Dict[str, float] = {}       # path -> monotonic time of last event
+        self._first_seen: Dict[str, float] = {}    # path -> monotonic time of first event in burst
+        self._synced: Dict[str, Optional[Signature]] = {}  # signature right after our own save
+        self._stop = threading.Event()
+        self.cycles = 0
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, max_cycles: Optional[int] = None):
+        COMManager.initialize_com()  # held for the daemon's life so warm sessions survive per-file cleanup
+        try:
+            self.processor = self.batch.load_processor(self.summary_path)
+            self.processor.session_pool = self.pool
+            self.snapshot = self.tracker.snapshot(self.processor.summary_data, self.processor.summary_columns())
+            backend = self.watcher.start()
+            print(f"\n👀 Watching {self.watcher.entity_folder} + {os.path.basename(self.summary_path)} "
+                  f"({backend}, debounce {self.config.watch_debounce:g}s) - Ctrl+C to stop")
+
+            plan = self.tracker.plan(self.watcher.entity_files(), self.snapshot)
+            if plan.selected:
+                print(f"   🔁 Catching up {len(plan.selected)} file(s) out of date since the last run")
+                self._sync(list(plan.selected), {fp: time.monotonic() for fp in plan.selected})
+            for fp in self.watcher.entity_files():
+                self._synced.setdefault(fp, file_signature(fp))
+
+            while not self._stop.is_set() and (max_cycles is None or self.cycles < max_cycles):
+                self._drain(timeout=0.2)
+                self._flush()
+        except KeyboardInterrupt:
+            print("\n🛑 Watch stopped")
+        finally:
+            self.watcher.stop()
+            if self.processor is not None:
+                self.processor.session_pool = None
+            self.pool.close()
+            self.batch.supervisor.shutdown()
+            COMManager.cleanup_com()
+            print(f"   📱 Excel instances started: {self.pool.created}, warm reuses: {self.pool.reused}")
+
+    # ---------- events ----------
+    def _drain(self, timeout: float):
+        try:
+            path = self.watcher.events.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            now = time.monotonic()
+            self._pending[path] = now
+            self._first_seen.setdefault(path, now)
+            try:
+                path = self.watcher.events.get_nowait()
+            except queue.Empty:
+                return
+
+    def _flush(self):
+        now = time.monotonic()
+        ready = [p for p, t in self._pending.items() if now - t >= self.config.watch_debounce]
+        if not ready:
+            return
+        for p in ready:
+            del self._pending[p]
+
+        summary_changed = False
+        files: List[str] = []
+        for path in ready:
+            if path == self.watcher.summary_path:
+                summary_changed = True
+            elif not os.path.exists(path):
+                self._first_seen.pop(path, None)
+            elif os.path.exists(os.path.join(os.path.dirname(path), '~$' + os.path.basename(path))):
+                print(f"   🔒 {os.path.basename(path)} is open in Excel, waiting until it is closed")
+                self._pending[path] = now
+            elif file_signature(path) == self._synced.get(path):
+                self._first_seen.pop(path, None)  # our own save echoing back
+            else:
+                files.append(path)
+
+        if summary_changed:
+            changed_at = self._first_seen.pop(self.watcher.summary_path, now)
+            files += [fp for fp in self._refresh_summary(changed_at) if fp not in files]
+        if files:
+            self._sync(files, self._first_seen)
+
+    def _refresh_summary(self, changed_at: float) -> List[str]:
+        print(f"\n📊 Summary changed, refreshing {os.path.basename(self.summary_path)}")
+        columns = self.processor.summary_columns()
+        new_snapshot = {}
+
+        def _changed(frame):
+            new_snapshot.update(self.tracker.snapshot(frame, columns))
+            return set(self.tracker.diff(self.snapshot, new_snapshot))
+
+        try:
+            changed = self.processor.refresh_summary(self.summary_path, _changed)
+        except Exception as e:
+            print(f"   ⚠️ Summary not readable yet ({e}), keeping the previous one until the next change")
+            return []
+        self.snapshot = new_snapshot
+        if not changed:
+            print("   ✅ No summary rows changed")
+            return []
+        plan = self.tracker.plan(self.watcher.entity_files(), self.snapshot)
+        self.tracker.print_plan(plan)
+        for fp in plan.selected:
+            self._first_seen.setdefault(fp, changed_at)
+        return list(plan.selected)
+
+    # ---------- sync ----------
+    def _sync(self, files: List[str], first_seen: Dict[str, float]):
+        self.cycles += 1
+        results: List[ProcessingResult] = []
+        for fp in files:
+            res = self.batch._process_with_retry(self.processor, fp)
+            results.append(res)
+            self._synced[fp] = file_signature(fp)
+            latency = time.monotonic() - first_seen.pop(fp, time.monotonic())
+            if res.status == 'success':
+                print(f"   ✅ {os.path.basename(fp)} synced {latency:.1f}s after change: "
+                      f"{res.rows_updated} upd, {res.rows_added} add")
+            else:
+                print(f"   ❌ {os.path.basename(fp)}: {res.error_message}")
+        self.tracker.record_run(results, self.snapshot)
+        if self.batch.change_log:
+            self.batch.change_log.close()  # flushed after every sync; restarts on the next record
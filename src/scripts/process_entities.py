@@ -4,17 +4,48 @@ import os
 # Add src directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-import glob, time, argparse
+import glob, time, argparse, dataclasses
 from excel_processor.config import DEFAULT_CONFIG
 from excel_processor.batch import RobustBatchProcessor
+from excel_processor.delta import SummaryDeltaTracker
+from excel_processor.scheduler import FileCostModel
 
 def main():
     parser = argparse.ArgumentParser(description="Process XLSB entities with summary mapping")
     parser.add_argument("--entity-folder", required=True, help="Folder chứa các *.xlsb")
-    parser.add_argument("--summary-path", required=True, help="Đường dẫn file tổng hợp Entities.xlsx")
-    parser.add_argument("--mode", choices=["seq", "par"], default="seq",
-                        help="seq=tuần tự (ổn định), par=‘song song bảo thủ’ (nhanh hơn)")
+    parser.add_argument("--summary-path", help="Đường dẫn file tổng hợp Entities.xlsx (bắt buộc khi chạy sync)")
+    parser.add_argument("--mode", choices=["seq", "par", "pipe", "proc"], default="seq",
+                        help="seq=tuần tự (ổn định), par=‘song song bảo thủ’ (nhanh hơn), "
+                             "pipe=pipeline prefetch/read/match/write chồng lấp, "
+                             "proc=process pool dùng chung summary qua memory-map")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="Chỉ chạy các file có subsidiary thay đổi trong summary so với lần chạy trước")
+    parser.add_argument("--state-dir", default=None,
+                        help="Thư mục lưu snapshot summary + index subsidiary (mặc định: <entity-folder>/../.sync_state)")
+    parser.add_argument("--profile", nargs="?", const="det", choices=["det", "sample"], default=None,
+                        help="Profile CPU theo từng file: det=cProfile (chính xác), sample=lấy mẫu stack "
+                             "(nhẹ hơn). Lưu dump từng file + in bảng hotspot tổng hợp")
+    parser.add_argument("--profile-dir", default=None,
+                        help="Thư mục lưu profile từng file (mặc định: <entity-folder>/../profiles/<thời gian>)")
+    parser.add_argument("--change-log", default=None,
+                        help="File CSV ghi từng ô thay đổi (file, sheet, dòng, cột, giá trị cũ/mới, dòng summary); "
+                             "mặc định: <entity-folder>/../change_log.csv")
+    parser.add_argument("--no-change-log", action="store_true", help="Không ghi change log")
+    parser.add_argument("--keep-order", action="store_true",
+                        help="Giữ thứ tự file theo thư mục thay vì xếp file tốn thời gian nhất lên trước")
+    parser.add_argument("--memory-profile", action="store_true",
+                        help="Đo peak RSS (kể cả Excel) và tracemalloc theo từng phase, ghi vào log")
+    parser.add_argument("--watch", action="store_true",
+                        help="Chạy liên tục: theo dõi thư mục entity + file summary, chỉ sync file vừa thay đổi "
+                             "(summary và Excel được giữ sẵn giữa các lần sync)")
+    parser.add_argument("--debounce", type=float, default=None,
+                        help="Số giây chờ sau lần lưu cuối trước khi sync (watch mode, mặc định 2)")
+    parser.add_argument("--list-files", action="store_true",
+                        help="Chỉ liệt kê các file *.xlsb sẽ được xử lý rồi thoát")
+    parser.add_argument("--show-state", action="store_true",
+                        help="In trạng thái index subsidiary / snapshot của lần chạy trước rồi thoát")
     args = parser.parse_args()
+    state_dir = args.state_dir or os.path.join(args.entity_folder, "..", ".sync_state")
 
     file_paths = [fp for fp in glob.glob(os.path.join(args.entity_folder, "*.xlsb"))
                   if not os.path.basename(fp).startswith('~')]
@@ -22,17 +53,74 @@ def main():
         print("❌ No XLSB files found!")
         return
 
+    if args.list_files:
+        for fp in file_paths:
+            print(f"{os.path.getsize(fp) / 1024 / 1024:8.1f} MB  {os.path.basename(fp)}")
+        return
+    if args.show_state:
+        SummaryDeltaTracker(state_dir).print_state(file_paths)
+        return
+    if not args.summary_path:
+        parser.error("--summary-path is required to run a sync")
+
     print(f"🎯 Found {len(file_paths)} files to process")
     print(f"📋 Files: {[os.path.basename(f) for f in file_paths]}")
 
-    processor = RobustBatchProcessor(DEFAULT_CONFIG)
+    config = DEFAULT_CONFIG
+    if args.memory_profile:
+        config = dataclasses.replace(config, memory_profiling=True)
+    if args.profile:
+        profile_dir = args.profile_dir or os.path.join(args.entity_folder, "..", "profiles",
+                                                       time.strftime("%Y%m%d-%H%M%S"))
+        config = dataclasses.replace(config, cpu_profile=args.profile, cpu_profile_dir=profile_dir)
+    if not args.no_change_log:
+        config = dataclasses.replace(config, change_log_path=args.change_log or os.path.join(
+            args.entity_folder, "..", "change_log.csv"))
+    if args.debounce is not None:
+        config = dataclasses.replace(config, watch_debounce=args.debounce)
+    processor = RobustBatchProcessor(config)
+    if args.watch:
+        from excel_processor.watcher import WatchDaemon
+        WatchDaemon(processor, args.entity_folder, args.summary_path, state_dir).run()
+        return
     t0 = time.time()
-    if args.mode == "seq":
+    # every run refreshes the dependency index + snapshot, so a later --changed-only run starts from it
+    tracker = SummaryDeltaTracker(state_dir)
+    summary = processor.load_processor(args.summary_path)
+    snapshot = tracker.snapshot(summary.summary_data, summary.summary_columns())
+    skipped = []
+    if args.changed_only:
+        plan = tracker.plan(file_paths, snapshot)
+        tracker.print_plan(plan)
+        skipped = tracker.skipped_results(plan)
+        file_paths = list(plan.selected)
+
+    costs = FileCostModel(state_dir)
+    # pipe runs one thread per stage, not N interchangeable workers: LPT and its prediction don't apply
+    if args.mode in ("par", "proc") and not args.keep_order and len(file_paths) > 1:
+        ordered = costs.order(file_paths)
+        costs.print_plan(file_paths, ordered, config.max_excel_instances, batched=args.mode == "par")
+        file_paths = ordered
+
+    if not file_paths:
+        print("\n✅ Nothing to sync")
+        results = []
+    elif args.mode == "seq":
         print("\n🛡️ Using SEQUENTIAL mode")
         results = processor.process_files_sequential_robust(file_paths, args.summary_path)
+    elif args.mode == "proc":
+        print("\n👷 Using PROCESS POOL mode")
+        results = processor.process_files_process_pool(file_paths, args.summary_path)
+    elif args.mode == "pipe":
+        print("\n🧵 Using PIPELINED mode")
+        results = processor.process_files_pipelined(file_paths, args.summary_path)
     else:
         print("\n⚡ Using CONSERVATIVE PARALLEL mode")
         results = processor.process_files_parallel_conservative(file_paths, args.summary_path)
+    if args.mode != "pipe":
+        costs.record_run(results)  # pipe per-file times include queue waits between stages
+    tracker.record_run(results, snapshot)
+    results = results + skipped
     total_time = time.time() - t0
 
     processor.print_enhanced_summary(results)
@@ -49,7 +137,10 @@ def main():
                         f"Rows updated: {r.rows_updated}\n"
                         f"Rows added: {r.rows_added}\n"
                         f"Processing time: {r.processing_time:.1f}s\n"
+                        f"Memory used: {r.memory_used_mb:.1f}MB (peak {r.memory_peak_mb:.1f}MB) "
+                        f"{r.memory_phases or ''}\n"
                         f"Error: {r.error_message}\n"
+                        f"Failure kind: {r.failure_kind} (attempts: {r.attempts})\n"
                         + "-"*30 + "\n")
         print(f"📄 Log saved to: {os.path.abspath(log_file)}")
     except Exception as e:
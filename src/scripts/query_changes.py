@@ -0,0 +1,59 @@
+# scripts/query_changes.py
+import sys
+import os
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import csv, argparse
+from collections import Counter
+from excel_processor.changelog import COLUMNS, query_changes
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the per-cell change log written by process_entities.py")
+    parser.add_argument("--log", required=True, help="Đường dẫn change_log.csv")
+    parser.add_argument("--tenant", default="", help="Lọc theo tenant (chứa chuỗi, không phân biệt hoa thường)")
+    parser.add_argument("--subsidiary", default="", help="Lọc theo subsidiary")
+    parser.add_argument("--file", default="", help="Lọc theo tên file entity")
+    parser.add_argument("--column", default="", help="Lọc theo cột, ví dụ GLA hoặc 'Rent (USD)'")
+    parser.add_argument("--limit", type=int, default=50, help="Số dòng in ra màn hình (0 = tất cả)")
+    parser.add_argument("--out", default=None, help="Xuất toàn bộ kết quả lọc ra file CSV")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log):
+        print(f"❌ Change log not found: {args.log}")
+        return
+
+    matches = query_changes(args.log, tenant=args.tenant, subsidiary=args.subsidiary,
+                            file=args.file, column=args.column)
+    writer = out_file = None
+    if args.out:
+        out_file = open(args.out, "w", newline="", encoding="utf-8")
+        writer = csv.DictWriter(out_file, fieldnames=COLUMNS)
+        writer.writeheader()
+
+    per_file = Counter()
+    shown = 0
+    try:
+        for row in matches:
+            per_file[row["file"]] += 1
+            if writer:
+                writer.writerow(row)
+            if not args.limit or shown < args.limit:
+                shown += 1
+                print(f"{row['synced_at']}  {row['file']} [{row['sheet']}] row {row['excel_row']} "
+                      f"{row['column']}: {row['old_value']!r} -> {row['new_value']!r} "
+                      f"({row['action']}, {row['subsidiary']} / {row['tenant']}, summary row {row['summary_row']})")
+    finally:
+        if out_file:
+            out_file.close()
+
+    total = sum(per_file.values())
+    print(f"\n🔎 {total} matching cell change(s) in {len(per_file)} file(s)" +
+          (f", showing {shown}" if shown < total else ""))
+    for name, n in per_file.most_common(10):
+        print(f"   {n:6d}  {name}")
+    if args.out:
+        print(f"📄 Exported to: {os.path.abspath(args.out)}")
+
+if __name__ == "__main__":
+    main()